@@ -0,0 +1,248 @@
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+import auth
+import crud
+import crud_async
+import models
+import refcache
+import schemas
+import search as product_search
+import watermark
+
+# JSON endpoints return ORJSONResponse directly with plain dicts built from
+# column rows, skipping ORM instances, response models and jsonable_encoder.
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+router = APIRouter(prefix="/api/v1", default_response_class=ORJSONResponse)
+
+def _rows(result) -> list:
+    return [row._asdict() for row in result]
+
+def _page(items: list, limit: int, key):
+    if len(items) <= limit:
+        return items, None
+    items = items[:limit]
+    return items, key(items[-1])
+
+def _statuses(status_filter: Optional[str]):
+    if status_filter is None:
+        return None
+    if status_filter == "open":
+        return crud.OPEN_STATUSES
+    if status_filter in models.DocStatus.__members__:
+        return [models.DocStatus(status_filter)]
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid status")
+
+@router.post("/token")
+async def create_token(credentials: schemas.TokenRequest, db: AsyncSession = Depends(get_async_db)):
+    user = await auth.authenticate_user(db, credentials.email, credentials.password)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email or password")
+    return ORJSONResponse({"access_token": auth.create_access_token(data={"sub": user.email}), "token_type": "bearer"})
+
+@router.get("/stock")
+async def stock(
+    request: Request,
+    search: Optional[str] = None,
+    after: Optional[int] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Search results are a single ranked page of at most SEARCH_LIMIT rows,
+    # so they take `limit` but have no cursor.
+    if search and after:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="after cannot be combined with search")
+
+    async def render():
+        stmt = select(
+            models.Product.id,
+            models.Product.sku,
+            models.Product.name,
+            models.Product.uom,
+            models.Product.reorder_level,
+            func.coalesce(func.sum(models.StockLevel.quantity_on_hand), 0.0).label("quantity")
+        ).join(
+            models.StockLevel,
+            models.Product.id == models.StockLevel.product_id,
+            isouter=True
+        ).where(
+            models.Product.is_active == True
+        ).group_by(models.Product.id)
+
+        if search:
+            product_ids = await crud_async.search_product_ids(db, search, min(limit, product_search.SEARCH_LIMIT))
+            rank = {product_id: position for position, product_id in enumerate(product_ids)}
+            items = _rows(await db.execute(stmt.where(models.Product.id.in_(product_ids))))
+            items.sort(key=lambda item: rank[item["id"]])
+            return ORJSONResponse({"items": items, "next": None})
+
+        if after:
+            stmt = stmt.where(models.Product.id > after)
+        items, next_cursor = _page(
+            _rows(await db.execute(stmt.order_by(models.Product.id).limit(limit + 1))), limit, lambda item: item["id"]
+        )
+        return ORJSONResponse({"items": items, "next": next_cursor})
+
+    return await watermark.conditional(request, db, current_user.id, render)
+
+@router.get("/stock/locations")
+async def stock_by_location(
+    request: Request,
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    location_id: Optional[int] = None,
+    after: Optional[int] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    async def render():
+        stmt = select(
+            models.StockLevel.id,
+            models.StockLevel.product_id,
+            models.Product.sku,
+            models.StockLevel.warehouse_id,
+            models.StockLevel.location_id,
+            models.StockLevel.quantity_on_hand.label("quantity")
+        ).join(models.Product, models.Product.id == models.StockLevel.product_id)
+
+        if product_id:
+            stmt = stmt.where(models.StockLevel.product_id == product_id)
+        if warehouse_id:
+            stmt = stmt.where(models.StockLevel.warehouse_id == warehouse_id)
+        if location_id:
+            stmt = stmt.where(models.StockLevel.location_id == location_id)
+        if after:
+            stmt = stmt.where(models.StockLevel.id > after)
+
+        items, next_cursor = _page(
+            _rows(await db.execute(stmt.order_by(models.StockLevel.id).limit(limit + 1))), limit, lambda item: item["id"]
+        )
+        locations = (await refcache.get_reference_data(db)).locations_by_id
+        for item in items:
+            location = locations.get(item["location_id"])
+            item["warehouse"] = location.warehouse.code if location else None
+            item["location"] = location.code if location else None
+        return ORJSONResponse({"items": items, "next": next_cursor})
+
+    return await watermark.conditional(request, db, current_user.id, render, warehouse_id or None)
+
+DOCUMENT_COLUMNS = (
+    models.Document.id,
+    models.Document.doc_type,
+    models.Document.status,
+    models.Document.supplier_name,
+    models.Document.customer_name,
+    models.Document.from_warehouse_id,
+    models.Document.from_location_id,
+    models.Document.to_warehouse_id,
+    models.Document.to_location_id,
+    models.Document.created_by,
+    models.Document.created_at,
+    models.Document.validated_at
+)
+
+async def _with_lines(db: AsyncSession, documents: list) -> list:
+    lines = {document["id"]: [] for document in documents}
+    if lines:
+        result = await db.execute(
+            select(
+                models.DocumentLine.document_id,
+                models.DocumentLine.product_id,
+                models.Product.sku,
+                models.DocumentLine.quantity
+            ).join(
+                models.Product, models.Product.id == models.DocumentLine.product_id
+            ).where(
+                models.DocumentLine.document_id.in_(lines.keys())
+            ).order_by(models.DocumentLine.id)
+        )
+        for document_id, product_id, sku, quantity in result:
+            lines[document_id].append({"product_id": product_id, "sku": sku, "quantity": quantity})
+    for document in documents:
+        document["lines"] = lines[document["id"]]
+    return documents
+
+@router.get("/documents")
+async def documents(
+    doc_type: Optional[models.DocType] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        stmt = crud.filter_documents(select(*DOCUMENT_COLUMNS), doc_type, _statuses(status_filter), cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    items, next_cursor = _page(
+        _rows(await db.execute(stmt.limit(limit + 1))), limit, lambda item: crud.encode_cursor(item["created_at"], item["id"])
+    )
+    return ORJSONResponse({"items": await _with_lines(db, items), "next": next_cursor})
+
+@router.get("/documents/{document_id}")
+async def document(
+    document_id: int,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    items = _rows(await db.execute(select(*DOCUMENT_COLUMNS).where(models.Document.id == document_id)))
+    if not items:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found")
+    return ORJSONResponse((await _with_lines(db, items))[0])
+
+@router.get("/moves")
+async def moves(
+    product_id: Optional[int] = None,
+    warehouse_id: Optional[int] = None,
+    location_id: Optional[int] = None,
+    move_type: Optional[models.MoveType] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    stmt = select(
+        models.StockMove.id,
+        models.StockMove.product_id,
+        models.Product.sku,
+        models.StockMove.from_warehouse_id,
+        models.StockMove.from_location_id,
+        models.StockMove.to_warehouse_id,
+        models.StockMove.to_location_id,
+        models.StockMove.quantity,
+        models.StockMove.move_type,
+        models.StockMove.document_id,
+        models.StockMove.created_at
+    ).join(models.Product, models.Product.id == models.StockMove.product_id)
+    try:
+        stmt = crud.filter_stock_moves(
+            stmt, cursor,
+            product_id=product_id,
+            warehouse_id=warehouse_id,
+            location_id=location_id,
+            move_type=move_type,
+            date_from=date_from,
+            date_to=date_to
+        )
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    items, next_cursor = _page(
+        _rows(await db.execute(stmt.limit(limit + 1))), limit, lambda item: crud.encode_cursor(item["created_at"], item["id"])
+    )
+    return ORJSONResponse({"items": items, "next": next_cursor})
@@ -1,197 +1,59 @@
-from fastapi import FastAPI, Request, Depends, Form, HTTPException, status
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, Depends, Form, File, HTTPException, Query, UploadFile, status
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
 import uvicorn
 
-from database import engine, get_db, Base
+from database import ASYNC_DATABASE_URL, async_engine, async_engine_args, engine, get_async_db, get_db
 import models
 import schemas
+import api
 import auth
 import crud
+import crud_async
+import events
+import exports
+import imports
+import metrics
+import querydebug
+import refcache
+import search as product_search
+import snapshots
+import valuation
+import watermark
 
 app = FastAPI(title="StockMaster")
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
+app.include_router(api.router)
+if querydebug.QUERY_DEBUG or querydebug.QUERY_BUDGET:
+    app.add_middleware(querydebug.QueryDebugMiddleware)
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
 templates = Jinja2Templates(directory="templates")
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
-    
-    db = next(get_db())
-    
-    admin_user = db.query(models.User).filter(models.User.email == "admin@example.com").first()
-    if not admin_user:
-        admin_user = models.User(
-            name="Admin User",
-            email="admin@example.com",
-            password_hash=auth.get_password_hash("admin123"),
-            role=models.UserRole.ADMIN
-        )
-        db.add(admin_user)
-        db.commit()
-        db.refresh(admin_user)
-    
-    if db.query(models.Warehouse).count() == 0:
-        warehouses_data = [
-            {"name": "Main Warehouse", "code": "WH/Stock", "address": "123 Main Street, Mumbai"},
-            {"name": "North Warehouse", "code": "WH/North", "address": "456 North Avenue, Delhi"},
-            {"name": "South Warehouse", "code": "WH/South", "address": "789 South Road, Bangalore"}
-        ]
-        
-        warehouses = []
-        for wh_data in warehouses_data:
-            wh = models.Warehouse(**wh_data)
-            db.add(wh)
-            warehouses.append(wh)
-        db.commit()
-        
-        for wh in warehouses:
-            db.refresh(wh)
-            locations_data = [
-                {"warehouse_id": wh.id, "name": "Zone A", "code": "A"},
-                {"warehouse_id": wh.id, "name": "Zone B", "code": "B"},
-                {"warehouse_id": wh.id, "name": "Zone C", "code": "C"}
-            ]
-            for loc_data in locations_data:
-                loc = models.Location(**loc_data)
-                db.add(loc)
-        db.commit()
-    
-    if db.query(models.Category).count() == 0:
-        categories = ["Electronics", "Furniture", "Office Supplies", "Hardware"]
-        for cat_name in categories:
-            cat = models.Category(name=cat_name)
-            db.add(cat)
-        db.commit()
-    
-    if db.query(models.Product).count() == 0:
-        category_map = {cat.name: cat.id for cat in db.query(models.Category).all()}
-        
-        products_data = [
-            {"name": "Desk", "sku": "DESK001", "category_id": category_map["Furniture"], "uom": "Units", "cost": 3000.0, "reorder_level": 10},
-            {"name": "Office Table", "sku": "TABLE001", "category_id": category_map["Furniture"], "uom": "Units", "cost": 3000.0, "reorder_level": 5},
-            {"name": "Office Chair", "sku": "CHAIR001", "category_id": category_map["Furniture"], "uom": "Units", "cost": 1500.0, "reorder_level": 15},
-            {"name": "Laptop", "sku": "LAP001", "category_id": category_map["Electronics"], "uom": "Units", "cost": 45000.0, "reorder_level": 5},
-            {"name": "Monitor", "sku": "MON001", "category_id": category_map["Electronics"], "uom": "Units", "cost": 12000.0, "reorder_level": 8},
-            {"name": "Keyboard", "sku": "KEY001", "category_id": category_map["Electronics"], "uom": "Units", "cost": 800.0, "reorder_level": 20},
-            {"name": "Mouse", "sku": "MOU001", "category_id": category_map["Electronics"], "uom": "Units", "cost": 400.0, "reorder_level": 25},
-            {"name": "Pen", "sku": "PEN001", "category_id": category_map["Office Supplies"], "uom": "Box", "cost": 50.0, "reorder_level": 100},
-            {"name": "Paper A4", "sku": "PAP001", "category_id": category_map["Office Supplies"], "uom": "Ream", "cost": 200.0, "reorder_level": 50},
-            {"name": "Stapler", "sku": "STA001", "category_id": category_map["Office Supplies"], "uom": "Units", "cost": 150.0, "reorder_level": 30}
-        ]
-        
-        products = []
-        for prod_data in products_data:
-            prod = models.Product(**prod_data)
-            db.add(prod)
-            products.append(prod)
-        db.commit()
-        
-        for prod in products:
-            db.refresh(prod)
-        
-        main_wh = db.query(models.Warehouse).filter(models.Warehouse.code == "WH/Stock").first()
-        zone_a = db.query(models.Location).filter(
-            models.Location.warehouse_id == main_wh.id,
-            models.Location.code == "A"
-        ).first()
-        
-        receipt = models.Document(
-            doc_type=models.DocType.RECEIPT,
-            status=models.DocStatus.DONE,
-            supplier_name="Aman Sharma",
-            to_warehouse_id=main_wh.id,
-            to_location_id=zone_a.id,
-            created_by=admin_user.id,
-            validated_at=datetime.utcnow()
-        )
-        db.add(receipt)
-        db.commit()
-        db.refresh(receipt)
-        
-        receipt_lines = [
-            {"document_id": receipt.id, "product_id": products[0].id, "quantity": 50},
-            {"document_id": receipt.id, "product_id": products[1].id, "quantity": 50},
-            {"document_id": receipt.id, "product_id": products[2].id, "quantity": 100},
-            {"document_id": receipt.id, "product_id": products[3].id, "quantity": 30},
-            {"document_id": receipt.id, "product_id": products[4].id, "quantity": 40}
-        ]
-        
-        for line_data in receipt_lines:
-            line = models.DocumentLine(**line_data)
-            db.add(line)
-            
-            stock = models.StockLevel(
-                product_id=line_data["product_id"],
-                warehouse_id=main_wh.id,
-                location_id=zone_a.id,
-                quantity_on_hand=line_data["quantity"]
-            )
-            db.add(stock)
-            
-            move = models.StockMove(
-                product_id=line_data["product_id"],
-                to_warehouse_id=main_wh.id,
-                to_location_id=zone_a.id,
-                quantity=line_data["quantity"],
-                move_type=models.MoveType.RECEIPT,
-                document_id=receipt.id
-            )
-            db.add(move)
-        
-        db.commit()
-        
-        pending_receipt = models.Document(
-            doc_type=models.DocType.RECEIPT,
-            status=models.DocStatus.READY,
-            supplier_name="Vendor ABC",
-            to_warehouse_id=main_wh.id,
-            to_location_id=zone_a.id,
-            created_by=admin_user.id
-        )
-        db.add(pending_receipt)
-        db.commit()
-        db.refresh(pending_receipt)
-        
-        pending_lines = [
-            {"document_id": pending_receipt.id, "product_id": products[5].id, "quantity": 50},
-            {"document_id": pending_receipt.id, "product_id": products[6].id, "quantity": 60}
-        ]
-        
-        for line_data in pending_lines:
-            line = models.DocumentLine(**line_data)
-            db.add(line)
-        db.commit()
-        
-        delivery = models.Document(
-            doc_type=models.DocType.DELIVERY,
-            status=models.DocStatus.READY,
-            customer_name="Aman Sharma",
-            from_warehouse_id=main_wh.id,
-            from_location_id=zone_a.id,
-            created_by=admin_user.id
-        )
-        db.add(delivery)
-        db.commit()
-        db.refresh(delivery)
-        
-        delivery_lines = [
-            {"document_id": delivery.id, "product_id": products[0].id, "quantity": 5},
-            {"document_id": delivery.id, "product_id": products[2].id, "quantity": 10}
-        ]
-        
-        for line_data in delivery_lines:
-            line = models.DocumentLine(**line_data)
-            db.add(line)
-        db.commit()
-
 @app.on_event("startup")
 async def startup_event():
-    init_db()
+    # Schema creation and demo data live in `manage.py init-db` / `seed`;
+    # a worker only opens its first pooled connection before serving.
+    async with async_engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+    if async_engine.dialect.name == "postgresql":
+        app.state.event_listener = asyncio.create_task(
+            events.listen(ASYNC_DATABASE_URL, async_engine_args.get("connect_args", {}))
+        )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    listener = getattr(app.state, "event_listener", None)
+    if listener is not None:
+        listener.cancel()
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
@@ -209,9 +71,9 @@ async def login(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = auth.authenticate_user(db, email, password)
+    user = await auth.authenticate_user(db, email, password)
     if not user:
         return templates.TemplateResponse(
             "login.html",
@@ -239,7 +101,7 @@ async def signup(
     email: str = Form(...),
     password: str = Form(...),
     confirm_password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if password != confirm_password:
         return templates.TemplateResponse(
@@ -253,14 +115,14 @@ async def signup(
             {"request": request, "error": "Password must be at least 6 characters"}
         )
     
-    existing_user = db.query(models.User).filter(models.User.email == email).first()
+    existing_user = await auth.get_user_by_email(db, email)
     if existing_user:
         return templates.TemplateResponse(
             "signup.html",
             {"request": request, "error": "Email already registered"}
         )
     
-    hashed_password = auth.get_password_hash(password)
+    hashed_password = await auth.get_password_hash_async(password)
     new_user = models.User(
         name=name,
         email=email,
@@ -268,8 +130,8 @@ async def signup(
         role=models.UserRole.STAFF
     )
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     access_token = auth.create_access_token(data={"sub": new_user.email})
     response = RedirectResponse(url="/dashboard", status_code=302)
@@ -282,7 +144,10 @@ async def signup(
     return response
 
 @app.get("/logout")
-async def logout():
+async def logout(request: Request):
+    token = request.cookies.get("access_token")
+    if token:
+        auth.user_cache.discard(token)
     response = RedirectResponse(url="/login", status_code=302)
     response.delete_cookie("access_token")
     return response
@@ -290,39 +155,44 @@ async def logout():
 @app.get("/dashboard", response_class=HTMLResponse)
 async def dashboard(
     request: Request,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    kpis = crud.get_dashboard_kpis(db)
-    recent_ops = crud.get_recent_operations(db)
+    async def render():
+        kpis = await crud_async.get_dashboard_kpis(db)
+        recent_ops = await crud_async.get_recent_operations(db)
+        
+        return templates.TemplateResponse(
+            "dashboard.html",
+            {
+                "request": request,
+                "user": current_user,
+                "kpis": kpis,
+                "kpi_counters": crud.KPI_COUNTERS,
+                "recent_operations": recent_ops
+            }
+        )
     
-    return templates.TemplateResponse(
-        "dashboard.html",
-        {
-            "request": request,
-            "user": current_user,
-            "kpis": kpis,
-            "recent_operations": recent_ops
-        }
-    )
+    return await watermark.conditional(request, db, current_user.id, render)
 
 @app.get("/products", response_class=HTMLResponse)
 async def products_page(
     request: Request,
     search: Optional[str] = None,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    query = db.query(models.Product).filter(models.Product.is_active == True)
+    reference = await refcache.get_reference_data(db)
     
     if search:
-        query = query.filter(
-            (models.Product.name.ilike(f"%{search}%")) |
-            (models.Product.sku.ilike(f"%{search}%"))
-        )
-    
-    products = query.all()
-    categories = db.query(models.Category).all()
+        product_ids = await crud_async.search_product_ids(db, search)
+        products = [
+            reference.products_by_id[product_id]
+            for product_id in product_ids
+            if product_id in reference.products_by_id
+        ]
+    else:
+        products = reference.products
     
     return templates.TemplateResponse(
         "products.html",
@@ -330,7 +200,7 @@ async def products_page(
             "request": request,
             "user": current_user,
             "products": products,
-            "categories": categories,
+            "categories": reference.categories,
             "search": search or ""
         }
     )
@@ -344,10 +214,10 @@ async def create_product(
     uom: str = Form(...),
     cost: float = Form(0.0),
     reorder_level: float = Form(0.0),
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    existing = db.query(models.Product).filter(models.Product.sku == sku).first()
+    existing = await db.scalar(select(models.Product).where(models.Product.sku == sku))
     if existing:
         return RedirectResponse(url="/products?error=SKU already exists", status_code=302)
     
@@ -360,27 +230,60 @@ async def create_product(
         reorder_level=reorder_level
     )
     db.add(product)
-    db.commit()
+    await crud_async.bump_counters(db, {"products.active": 1})
+    await refcache.bump_version_async(db)
+    await db.commit()
+    product_search.invalidate()
     
     return RedirectResponse(url="/products", status_code=302)
 
+@app.post("/products/import")
+def import_products(
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    try:
+        report = imports.import_products(db, file.file, imports.detect_format(file.filename, format))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return JSONResponse(report)
+
 @app.get("/stock", response_class=HTMLResponse)
 async def stock_page(
     request: Request,
     search: Optional[str] = None,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    stock_items = crud.get_stock_summary(db, search)
+    async def render():
+        stock_items = await crud_async.get_stock_summary(db, search)
+        
+        return templates.TemplateResponse(
+            "stock.html",
+            {
+                "request": request,
+                "user": current_user,
+                "stock_items": stock_items,
+                "search": search or ""
+            }
+        )
     
-    return templates.TemplateResponse(
-        "stock.html",
-        {
-            "request": request,
-            "user": current_user,
-            "stock_items": stock_items,
-            "search": search or ""
-        }
+    return await watermark.conditional(request, db, current_user.id, render)
+
+@app.get("/events")
+async def change_events(
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # The stream outlives the request's session; release its connection now
+    # rather than holding it until the client goes away.
+    await db.close()
+    return StreamingResponse(
+        events.stream(events.broker.subscribe()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 @app.post("/stock/update")
@@ -389,52 +292,152 @@ async def update_stock(
     product_id: int = Form(...),
     adjustment: float = Form(...),
     reason: Optional[str] = Form(None),
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        crud.update_stock_from_interface(db, product_id, adjustment, current_user.id, reason)
+        await crud_async.update_stock_from_interface(db, product_id, adjustment, current_user.id, reason)
         return RedirectResponse(url="/stock", status_code=302)
     except ValueError as e:
         return RedirectResponse(url=f"/stock?error={str(e)}", status_code=302)
 
+@app.get("/reports/valuation", response_class=HTMLResponse)
+async def valuation_report(
+    request: Request,
+    top: int = Query(valuation.VALUATION_TOP_N, ge=1, le=1000),
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    report = await valuation.get_valuation(db, top)
+    
+    return templates.TemplateResponse(
+        "valuation.html",
+        {
+            "request": request,
+            "user": current_user,
+            "report": report,
+            "top": top
+        }
+    )
+
+def _as_of(value: str) -> datetime:
+    if len(value) == 10:
+        return datetime.fromisoformat(value) + timedelta(days=1)
+    return snapshots.parse_timestamp(value)
+
+@app.get("/stock/as-of")
+async def stock_as_of(
+    at: str,
+    sku: Optional[str] = None,
+    warehouse_id: Optional[int] = None,
+    location_id: Optional[int] = None,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        as_of = _as_of(at)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid date")
+    
+    product_id = None
+    if sku:
+        product_id = await db.scalar(select(models.Product.id).where(models.Product.sku == sku))
+        if product_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+    
+    result = await crud_async.stock_as_of(db, as_of, product_id, warehouse_id, location_id)
+    
+    reference = await refcache.get_reference_data(db)
+    warehouses = {warehouse.id: warehouse.code for warehouse in reference.warehouses}
+    locations = {location.id: location.code for location in reference.locations}
+    for item in result["items"]:
+        product = reference.products_by_id.get(item["product_id"])
+        item["sku"] = product.sku if product else None
+        item["warehouse"] = warehouses.get(item["warehouse_id"])
+        item["location"] = locations.get(item["location_id"])
+    
+    return JSONResponse(result)
+
+def _form_lines(form_data) -> list:
+    return [
+        (int(product_id), float(quantity))
+        for product_id, quantity in zip(form_data.getlist("product_id[]"), form_data.getlist("quantity[]"))
+        if product_id and quantity
+    ]
+
+@app.post("/operations/documents", status_code=status.HTTP_201_CREATED)
+async def create_document(
+    document: schemas.DocumentCreate,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        document_id = await crud_async.create_document(
+            db,
+            models.DocType(document.doc_type),
+            document.model_dump(exclude={"doc_type", "lines"}),
+            [(line.product_id, line.quantity) for line in document.lines],
+            current_user.id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"id": document_id}
+
+async def _document_list(request: Request, db: AsyncSession, doc_type: models.DocType, status_filter: Optional[str], cursor: Optional[str]):
+    if status_filter == "open":
+        statuses = crud.OPEN_STATUSES
+    elif status_filter in models.DocStatus.__members__:
+        statuses = [models.DocStatus(status_filter)]
+    else:
+        status_filter, statuses = None, None
+    
+    try:
+        documents, next_cursor = await crud_async.list_documents(db, doc_type, statuses, cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    
+    return documents, {
+        "status_filter": status_filter or "",
+        "next_url": str(request.url.include_query_params(cursor=next_cursor)) if next_cursor else None,
+        "first_url": str(request.url.remove_query_params("cursor")) if cursor else None
+    }
+
 @app.get("/operations/receipts", response_class=HTMLResponse)
 async def receipts_list(
     request: Request,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    status_filter: Optional[str] = Query(None, alias="status"),
+    cursor: Optional[str] = None,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    receipts = db.query(models.Document).filter(
-        models.Document.doc_type == models.DocType.RECEIPT
-    ).order_by(models.Document.created_at.desc()).all()
+    receipts, pagination = await _document_list(request, db, models.DocType.RECEIPT, status_filter, cursor)
     
     return templates.TemplateResponse(
         "receipts_list.html",
         {
             "request": request,
             "user": current_user,
-            "receipts": receipts
+            "receipts": receipts,
+            **pagination
         }
     )
 
 @app.get("/operations/receipts/new", response_class=HTMLResponse)
 async def receipt_form(
     request: Request,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    warehouses = db.query(models.Warehouse).all()
-    locations = db.query(models.Location).all()
-    products = db.query(models.Product).filter(models.Product.is_active == True).all()
+    reference = await refcache.get_reference_data(db)
     
     return templates.TemplateResponse(
         "receipt_form.html",
         {
             "request": request,
             "user": current_user,
-            "warehouses": warehouses,
-            "locations": locations,
-            "products": products
+            "warehouses": reference.warehouses,
+            "locations": reference.locations,
+            "products": reference.products
         }
     )
 
@@ -444,88 +447,81 @@ async def create_receipt(
     supplier_name: str = Form(...),
     to_warehouse_id: int = Form(...),
     to_location_id: int = Form(...),
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    form_data = await request.form()
-    
-    document = models.Document(
-        doc_type=models.DocType.RECEIPT,
-        status=models.DocStatus.READY,
-        supplier_name=supplier_name,
-        to_warehouse_id=to_warehouse_id,
-        to_location_id=to_location_id,
-        created_by=current_user.id
-    )
-    db.add(document)
-    db.commit()
-    db.refresh(document)
-    
-    product_ids = form_data.getlist("product_id[]")
-    quantities = form_data.getlist("quantity[]")
-    
-    for product_id, quantity in zip(product_ids, quantities):
-        if product_id and quantity:
-            line = models.DocumentLine(
-                document_id=document.id,
-                product_id=int(product_id),
-                quantity=float(quantity)
-            )
-            db.add(line)
-    
-    db.commit()
+    header = {"supplier_name": supplier_name, "to_warehouse_id": to_warehouse_id, "to_location_id": to_location_id}
+    try:
+        await crud_async.create_document(
+            db, models.DocType.RECEIPT, header, _form_lines(await request.form()), current_user.id
+        )
+    except ValueError as e:
+        return RedirectResponse(url=f"/operations/receipts/new?error={str(e)}", status_code=302)
     
     return RedirectResponse(url="/operations/receipts", status_code=302)
 
 @app.post("/operations/receipts/{receipt_id}/validate")
 async def validate_receipt(
     receipt_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        crud.validate_receipt(db, receipt_id)
+        await crud_async.validate_receipt(db, receipt_id)
         return RedirectResponse(url="/operations/receipts", status_code=302)
     except ValueError as e:
         return RedirectResponse(url=f"/operations/receipts?error={str(e)}", status_code=302)
 
+@app.post("/operations/documents/{document_id}/lines/import")
+def import_document_lines(
+    document_id: int,
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: Session = Depends(get_db)
+):
+    try:
+        report = imports.import_document_lines(db, document_id, file.file, imports.detect_format(file.filename, format))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return JSONResponse(report)
+
 @app.get("/operations/deliveries", response_class=HTMLResponse)
 async def deliveries_list(
     request: Request,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    status_filter: Optional[str] = Query(None, alias="status"),
+    cursor: Optional[str] = None,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    deliveries = db.query(models.Document).filter(
-        models.Document.doc_type == models.DocType.DELIVERY
-    ).order_by(models.Document.created_at.desc()).all()
+    deliveries, pagination = await _document_list(request, db, models.DocType.DELIVERY, status_filter, cursor)
     
     return templates.TemplateResponse(
         "deliveries_list.html",
         {
             "request": request,
             "user": current_user,
-            "deliveries": deliveries
+            "deliveries": deliveries,
+            **pagination
         }
     )
 
 @app.get("/operations/deliveries/new", response_class=HTMLResponse)
 async def delivery_form(
     request: Request,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    warehouses = db.query(models.Warehouse).all()
-    locations = db.query(models.Location).all()
-    products = db.query(models.Product).filter(models.Product.is_active == True).all()
+    reference = await refcache.get_reference_data(db)
     
     return templates.TemplateResponse(
         "delivery_form.html",
         {
             "request": request,
             "user": current_user,
-            "warehouses": warehouses,
-            "locations": locations,
-            "products": products
+            "warehouses": reference.warehouses,
+            "locations": reference.locations,
+            "products": reference.products
         }
     )
 
@@ -535,47 +531,27 @@ async def create_delivery(
     customer_name: str = Form(...),
     from_warehouse_id: int = Form(...),
     from_location_id: int = Form(...),
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    form_data = await request.form()
-    
-    document = models.Document(
-        doc_type=models.DocType.DELIVERY,
-        status=models.DocStatus.READY,
-        customer_name=customer_name,
-        from_warehouse_id=from_warehouse_id,
-        from_location_id=from_location_id,
-        created_by=current_user.id
-    )
-    db.add(document)
-    db.commit()
-    db.refresh(document)
-    
-    product_ids = form_data.getlist("product_id[]")
-    quantities = form_data.getlist("quantity[]")
-    
-    for product_id, quantity in zip(product_ids, quantities):
-        if product_id and quantity:
-            line = models.DocumentLine(
-                document_id=document.id,
-                product_id=int(product_id),
-                quantity=float(quantity)
-            )
-            db.add(line)
-    
-    db.commit()
+    header = {"customer_name": customer_name, "from_warehouse_id": from_warehouse_id, "from_location_id": from_location_id}
+    try:
+        await crud_async.create_document(
+            db, models.DocType.DELIVERY, header, _form_lines(await request.form()), current_user.id
+        )
+    except ValueError as e:
+        return RedirectResponse(url=f"/operations/deliveries/new?error={str(e)}", status_code=302)
     
     return RedirectResponse(url="/operations/deliveries", status_code=302)
 
 @app.post("/operations/deliveries/{delivery_id}/validate")
 async def validate_delivery(
     delivery_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        crud.validate_delivery(db, delivery_id)
+        await crud_async.validate_delivery(db, delivery_id)
         return RedirectResponse(url="/operations/deliveries", status_code=302)
     except ValueError as e:
         return RedirectResponse(url=f"/operations/deliveries?error={str(e)}", status_code=302)
@@ -583,40 +559,39 @@ async def validate_delivery(
 @app.get("/operations/adjustments", response_class=HTMLResponse)
 async def adjustments_list(
     request: Request,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    status_filter: Optional[str] = Query(None, alias="status"),
+    cursor: Optional[str] = None,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    adjustments = db.query(models.Document).filter(
-        models.Document.doc_type == models.DocType.ADJUSTMENT
-    ).order_by(models.Document.created_at.desc()).all()
+    adjustments, pagination = await _document_list(request, db, models.DocType.ADJUSTMENT, status_filter, cursor)
     
     return templates.TemplateResponse(
         "adjustments_list.html",
         {
             "request": request,
             "user": current_user,
-            "adjustments": adjustments
+            "adjustments": adjustments,
+            **pagination
         }
     )
 
 @app.get("/operations/adjustments/new", response_class=HTMLResponse)
 async def adjustment_form(
     request: Request,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    warehouses = db.query(models.Warehouse).all()
-    locations = db.query(models.Location).all()
-    products = db.query(models.Product).filter(models.Product.is_active == True).all()
+    reference = await refcache.get_reference_data(db)
     
     return templates.TemplateResponse(
         "adjustment_form.html",
         {
             "request": request,
             "user": current_user,
-            "warehouses": warehouses,
-            "locations": locations,
-            "products": products
+            "warehouses": reference.warehouses,
+            "locations": reference.locations,
+            "products": reference.products
         }
     )
 
@@ -625,64 +600,140 @@ async def create_adjustment(
     request: Request,
     to_warehouse_id: int = Form(...),
     to_location_id: int = Form(...),
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    form_data = await request.form()
-    
-    document = models.Document(
-        doc_type=models.DocType.ADJUSTMENT,
-        status=models.DocStatus.READY,
-        to_warehouse_id=to_warehouse_id,
-        to_location_id=to_location_id,
-        created_by=current_user.id
-    )
-    db.add(document)
-    db.commit()
-    db.refresh(document)
-    
-    product_ids = form_data.getlist("product_id[]")
-    quantities = form_data.getlist("quantity[]")
-    
-    for product_id, quantity in zip(product_ids, quantities):
-        if product_id and quantity:
-            line = models.DocumentLine(
-                document_id=document.id,
-                product_id=int(product_id),
-                quantity=float(quantity)
-            )
-            db.add(line)
-    
-    db.commit()
+    header = {"to_warehouse_id": to_warehouse_id, "to_location_id": to_location_id}
+    try:
+        await crud_async.create_document(
+            db, models.DocType.ADJUSTMENT, header, _form_lines(await request.form()), current_user.id
+        )
+    except ValueError as e:
+        return RedirectResponse(url=f"/operations/adjustments/new?error={str(e)}", status_code=302)
     
     return RedirectResponse(url="/operations/adjustments", status_code=302)
 
 @app.post("/operations/adjustments/{adjustment_id}/validate")
 async def validate_adjustment(
     adjustment_id: int,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        crud.validate_adjustment(db, adjustment_id)
+        await crud_async.validate_adjustment(db, adjustment_id)
         return RedirectResponse(url="/operations/adjustments", status_code=302)
     except ValueError as e:
         return RedirectResponse(url=f"/operations/adjustments?error={str(e)}", status_code=302)
 
+@app.post("/operations/validate")
+async def validate_documents(
+    batch: schemas.BatchValidation,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        results = await crud_async.validate_documents(db, batch.document_ids, atomic=batch.mode == "atomic")
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    validated = sum(result["validated"] for result in results)
+    return JSONResponse(
+        {"mode": batch.mode, "validated": validated, "failed": len(results) - validated, "results": results},
+        status_code=status.HTTP_409_CONFLICT if batch.mode == "atomic" and validated < len(results) else status.HTTP_200_OK
+    )
+
+@app.get("/operations/transfers", response_class=HTMLResponse)
+async def transfers_list(
+    request: Request,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    cursor: Optional[str] = None,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    transfers, pagination = await _document_list(request, db, models.DocType.TRANSFER, status_filter, cursor)
+    reference = await refcache.get_reference_data(db)
+    
+    return templates.TemplateResponse(
+        "transfers_list.html",
+        {
+            "request": request,
+            "user": current_user,
+            "transfers": transfers,
+            "locations": reference.locations_by_id,
+            **pagination
+        }
+    )
+
+@app.get("/operations/transfers/new", response_class=HTMLResponse)
+async def transfer_form(
+    request: Request,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    reference = await refcache.get_reference_data(db)
+    
+    return templates.TemplateResponse(
+        "transfer_form.html",
+        {
+            "request": request,
+            "user": current_user,
+            "warehouses": reference.warehouses,
+            "locations": reference.locations,
+            "products": reference.products
+        }
+    )
+
+@app.post("/operations/transfers/new")
+async def create_transfer(
+    request: Request,
+    from_warehouse_id: int = Form(...),
+    from_location_id: int = Form(...),
+    to_warehouse_id: int = Form(...),
+    to_location_id: int = Form(...),
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    header = {
+        "from_warehouse_id": from_warehouse_id,
+        "from_location_id": from_location_id,
+        "to_warehouse_id": to_warehouse_id,
+        "to_location_id": to_location_id
+    }
+    try:
+        await crud_async.create_document(
+            db, models.DocType.TRANSFER, header, _form_lines(await request.form()), current_user.id
+        )
+    except ValueError as e:
+        return RedirectResponse(url=f"/operations/transfers/new?error={str(e)}", status_code=302)
+    
+    return RedirectResponse(url="/operations/transfers", status_code=302)
+
+@app.post("/operations/transfers/{transfer_id}/validate")
+async def validate_transfer(
+    transfer_id: int,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    try:
+        await crud_async.validate_transfer(db, transfer_id)
+        return RedirectResponse(url="/operations/transfers", status_code=302)
+    except ValueError as e:
+        return RedirectResponse(url=f"/operations/transfers?error={str(e)}", status_code=302)
+
 @app.get("/settings/warehouses", response_class=HTMLResponse)
 async def warehouses_page(
     request: Request,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    warehouses = db.query(models.Warehouse).all()
+    reference = await refcache.get_reference_data(db)
     
     return templates.TemplateResponse(
         "warehouses.html",
         {
             "request": request,
             "user": current_user,
-            "warehouses": warehouses
+            "warehouses": reference.warehouses
         }
     )
 
@@ -692,10 +743,10 @@ async def create_warehouse(
     name: str = Form(...),
     code: str = Form(...),
     address: Optional[str] = Form(None),
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    existing = db.query(models.Warehouse).filter(models.Warehouse.code == code).first()
+    existing = await db.scalar(select(models.Warehouse).where(models.Warehouse.code == code))
     if existing:
         return RedirectResponse(url="/settings/warehouses?error=Code already exists", status_code=302)
     
@@ -705,26 +756,26 @@ async def create_warehouse(
         address=address
     )
     db.add(warehouse)
-    db.commit()
+    await refcache.bump_version_async(db)
+    await db.commit()
     
     return RedirectResponse(url="/settings/warehouses", status_code=302)
 
 @app.get("/settings/locations", response_class=HTMLResponse)
 async def locations_page(
     request: Request,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    warehouses = db.query(models.Warehouse).all()
-    locations = db.query(models.Location).all()
+    reference = await refcache.get_reference_data(db)
     
     return templates.TemplateResponse(
         "locations.html",
         {
             "request": request,
             "user": current_user,
-            "warehouses": warehouses,
-            "locations": locations
+            "warehouses": reference.warehouses,
+            "locations": reference.locations
         }
     )
 
@@ -734,13 +785,13 @@ async def create_location(
     warehouse_id: int = Form(...),
     name: str = Form(...),
     code: str = Form(...),
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    existing = db.query(models.Location).filter(
+    existing = await db.scalar(select(models.Location).where(
         models.Location.warehouse_id == warehouse_id,
         models.Location.code == code
-    ).first()
+    ))
     if existing:
         return RedirectResponse(url="/settings/locations?error=Code already exists in this warehouse", status_code=302)
     
@@ -750,28 +801,137 @@ async def create_location(
         code=code
     )
     db.add(location)
-    db.commit()
+    await refcache.bump_version_async(db)
+    await db.commit()
     
     return RedirectResponse(url="/settings/locations", status_code=302)
 
+def _optional_int(value: Optional[str]) -> Optional[int]:
+    if value is None or value.strip() == "":
+        return None
+    return int(value)
+
 @app.get("/operations/moves", response_class=HTMLResponse)
 async def moves_history(
     request: Request,
-    current_user: models.User = Depends(auth.get_current_user),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    sku: Optional[str] = None,
+    warehouse_id: Optional[str] = None,
+    location_id: Optional[str] = None,
+    move_type: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    moves = db.query(models.StockMove).order_by(
-        models.StockMove.created_at.desc()
-    ).limit(100).all()
+    try:
+        filters = {
+            "sku": sku or "",
+            "warehouse_id": _optional_int(warehouse_id),
+            "location_id": _optional_int(location_id),
+            "move_type": move_type or "",
+            "date_from": date_from or "",
+            "date_to": date_to or ""
+        }
+        
+        product_id = None
+        if sku:
+            product_id = await db.scalar(select(models.Product.id).where(models.Product.sku == sku)) or -1
+        
+        moves, next_cursor = await crud_async.get_stock_moves(
+            db,
+            cursor=cursor,
+            product_id=product_id,
+            warehouse_id=filters["warehouse_id"],
+            location_id=filters["location_id"],
+            move_type=models.MoveType(move_type) if move_type else None,
+            date_from=datetime.fromisoformat(date_from) if date_from else None,
+            date_to=datetime.fromisoformat(date_to) + timedelta(days=1) if date_to else None
+        )
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid filter")
+    
+    reference = await refcache.get_reference_data(db)
     
     return templates.TemplateResponse(
         "moves_history.html",
         {
             "request": request,
             "user": current_user,
-            "moves": moves
+            "moves": moves,
+            "filters": filters,
+            "warehouses": reference.warehouses,
+            "locations": reference.locations,
+            "move_types": list(models.MoveType),
+            "next_url": str(request.url.include_query_params(cursor=next_cursor)) if next_cursor else None,
+            "first_url": str(request.url.remove_query_params("cursor")) if cursor else None
         }
     )
 
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson"
+}
+
+def _export_response(name: str, columns, statement, fmt: str, compress: bool):
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported export format")
+    
+    filename = f"{name}-{datetime.utcnow():%Y%m%d%H%M%S}.{fmt}" + (".gz" if compress else "")
+    return StreamingResponse(
+        exports.stream_export(columns, statement, fmt, compress),
+        media_type="application/gzip" if compress else EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/export/moves")
+async def export_moves(
+    format: str = "csv",
+    gzip: bool = False,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user)
+):
+    return _export_response(
+        "stock-moves",
+        exports.MOVE_COLUMNS,
+        exports.moves_statement(date_from, date_to),
+        format,
+        gzip
+    )
+
+@app.get("/export/stock")
+async def export_stock(
+    format: str = "csv",
+    gzip: bool = False,
+    current_user: auth.UserSnapshot = Depends(auth.get_current_user)
+):
+    return _export_response(
+        "stock-levels",
+        exports.STOCK_COLUMNS,
+        exports.stock_statement(),
+        format,
+        gzip
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint(request: Request):
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if metrics.METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    
+    body = metrics.render(
+        {"sync": engine, "async": async_engine.sync_engine},
+        [
+            ("stockmaster_password_hash_pool", "Password hashing pool statistics", auth.password_hash_pool.stats()),
+            ("stockmaster_user_cache", "Authenticated user cache statistics", auth.user_cache.stats()),
+            ("stockmaster_reference_cache", "Reference data cache statistics", refcache.reference_cache.stats()),
+            ("stockmaster_page_cache", "Rendered page cache statistics", watermark.page_cache.stats()),
+            ("stockmaster_event_broker", "Live change event broker statistics", events.broker.stats())
+        ]
+    )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run("app:app", host="0.0.0.0", port=5000, reload=True)
@@ -1,18 +1,32 @@
+import asyncio
 import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 import models
+import refcache
 
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 1
 
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+USER_CACHE_CHECK_INTERVAL = float(os.getenv("USER_CACHE_CHECK_INTERVAL", "2"))
+
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
@@ -22,6 +36,78 @@ def get_password_hash(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+class PasswordHashPool:
+    def __init__(self, kind: str, workers: int, max_queue: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self._semaphore = asyncio.Semaphore(workers)
+        self.completed = 0
+        self.rejected = 0
+        self.waiting = 0
+        self.running = 0
+        self.queue_seconds_total = 0.0
+        self.queue_seconds_max = 0.0
+        self.run_seconds_total = 0.0
+    
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+    
+    async def run(self, func, *args):
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent sign-ins, please retry"
+            )
+        
+        enqueued = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        
+        started = time.perf_counter()
+        queued = started - enqueued
+        self.queue_seconds_total += queued
+        self.queue_seconds_max = max(self.queue_seconds_max, queued)
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self.run_seconds_total += time.perf_counter() - started
+            self._semaphore.release()
+    
+    def stats(self):
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "waiting": self.waiting,
+            "running": self.running,
+            "queue_seconds_total": self.queue_seconds_total,
+            "queue_seconds_max": self.queue_seconds_max,
+            "run_seconds_total": self.run_seconds_total
+        }
+
+password_hash_pool = PasswordHashPool(PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_QUEUE)
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hash_pool.run(get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hash_pool.run(verify_password, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -32,8 +118,110 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(request: Request, db: Session = Depends(get_db)) -> models.User:
+class UserSnapshot(NamedTuple):
+    id: int
+    name: str
+    email: str
+    role: models.UserRole
+
+class UserCache:
+    # Role and password changes bump the "users" cache version in their own
+    # transaction; every worker compares it at most once per check_interval
+    # and drops all cached tokens when it moved.
+    def __init__(self, ttl: int, max_size: int, check_interval: float):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.check_interval = check_interval
+        self._entries = OrderedDict()
+        self._tokens_by_user = {}
+        self.version = None
+        self.checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    async def check(self, db: AsyncSession):
+        if time.monotonic() - self.checked_at < self.check_interval:
+            return
+        version = (await db.scalar(refcache.version_statement(refcache.USERS_VERSION_KEY))) or 0
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._tokens_by_user.clear()
+            self.version = version
+        self.checked_at = time.monotonic()
+    
+    def get(self, token: str) -> Optional[UserSnapshot]:
+        entry = self._entries.get(token)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self.discard(token)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return entry[1]
+    
+    def put(self, token: str, user: UserSnapshot, expires_at: float):
+        ttl = min(self.ttl, expires_at - time.time())
+        if ttl <= 0:
+            return
+        self.discard(token)
+        self._entries[token] = (time.monotonic() + ttl, user)
+        self._tokens_by_user.setdefault(user.id, set()).add(token)
+        while len(self._entries) > self.max_size:
+            self.discard(next(iter(self._entries)))
+            self.evictions += 1
+    
+    def discard(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[1].id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_user[entry[1].id]
+    
+    def invalidate_user(self, user_id: int):
+        for token in list(self._tokens_by_user.get(user_id, ())):
+            self.discard(token)
+        self.invalidations += 1
+    
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+user_cache = UserCache(USER_CACHE_TTL, USER_CACHE_SIZE, USER_CACHE_CHECK_INTERVAL)
+
+@event.listens_for(models.User, "after_update")
+def _invalidate_cached_user(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.role.history.has_changes() or state.attrs.password_hash.history.has_changes():
+        connection.execute(refcache.bump_statement(connection, refcache.USERS_VERSION_KEY))
+        user_cache.invalidate_user(target.id)
+
+@event.listens_for(models.User, "after_delete")
+def _forget_deleted_user(mapper, connection, target):
+    connection.execute(refcache.bump_statement(connection, refcache.USERS_VERSION_KEY))
+    user_cache.invalidate_user(target.id)
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
+
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_async_db)) -> UserSnapshot:
     token = request.cookies.get("access_token")
+    if not token:
+        scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer":
+            token = credentials
     
     if not token:
         raise HTTPException(
@@ -41,6 +229,11 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> models.
             detail="Not authenticated"
         )
     
+    await user_cache.check(db)
+    cached = user_cache.get(token)
+    if cached is not None:
+        return cached
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -55,19 +248,21 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> models.
             detail="Invalid authentication credentials"
         )
     
-    user = db.query(models.User).filter(models.User.email == email).first()
+    user = await get_user_by_email(db, email)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
     
-    return user
+    snapshot = UserSnapshot(user.id, user.name, user.email, user.role)
+    user_cache.put(token, snapshot, payload["exp"])
+    return snapshot
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(models.User).filter(models.User.email == email).first()
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await get_user_by_email(db, email)
     if not user:
         return False
-    if not verify_password(password, user.password_hash):
+    if not await verify_password_async(password, user.password_hash):
         return False
     return user
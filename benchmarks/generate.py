@@ -0,0 +1,440 @@
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import random
+import sys
+import time
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from itertools import accumulate
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BATCH_SIZE = 10000
+LOCATIONS_PER_CHUNK = 24
+OPEN_DOCUMENT_RATIO = 200
+MAX_LINES = 5
+CATEGORIES = [
+    "Electronics", "Furniture", "Office Supplies", "Hardware", "Packaging", "Consumables",
+    "Apparel", "Tools", "Cleaning", "Safety", "Food", "Spare Parts"
+]
+UOMS = ["Units", "Box", "Ream", "Kg", "Pack"]
+# Relative activity per hour of day (UTC), weighted towards a working day.
+HOUR_PROFILE = [1, 1, 1, 1, 1, 2, 4, 8, 12, 14, 14, 13, 10, 12, 14, 13, 11, 8, 5, 3, 2, 2, 1, 1]
+CONFIG_KEYS = ("random_seed", "products", "warehouses", "locations", "moves", "days", "skew", "chunk_products")
+
+DOCUMENT_COLUMNS = (
+    "id", "doc_type", "status", "from_warehouse_id", "from_location_id", "to_warehouse_id", "to_location_id",
+    "supplier_name", "customer_name", "created_by", "created_at", "updated_at", "validated_at"
+)
+LINE_COLUMNS = ("id", "document_id", "product_id", "quantity")
+MOVE_COLUMNS = (
+    "id", "product_id", "from_warehouse_id", "from_location_id", "to_warehouse_id", "to_location_id",
+    "quantity", "move_type", "document_id", "created_at"
+)
+PRODUCT_COLUMNS = ("id", "name", "sku", "category_id", "uom", "cost", "reorder_level", "is_active", "created_at", "updated_at")
+LEVEL_COLUMNS = ("product_id", "warehouse_id", "location_id", "quantity_on_hand")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a large, skewed StockMaster dataset for capacity testing")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL", "sqlite:///./benchmark.db"))
+    parser.add_argument("--products", type=int, default=500000)
+    parser.add_argument("--warehouses", type=int, default=50)
+    parser.add_argument("--locations", type=int, default=200, help="Locations per warehouse")
+    parser.add_argument("--moves", type=int, default=100000000)
+    parser.add_argument("--days", type=int, default=730, help="Spread activity over this many days")
+    parser.add_argument("--end", type=datetime.fromisoformat,
+                        help="Timestamp of the newest activity (default: today at midnight UTC)")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent for product popularity")
+    parser.add_argument("--chunk-products", type=int, default=500, help="Products generated per unit of work")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--defer-indexes", action="store_true",
+                        help="Drop secondary indexes on documents, lines and moves while loading")
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    return parser.parse_args(argv)
+
+def _progress_table():
+    from sqlalchemy import Column, DateTime, Integer, MetaData, Table, Text
+
+    return Table(
+        "generator_progress", MetaData(),
+        Column("chunk", Integer, primary_key=True),
+        Column("moves", Integer, nullable=False, default=0),
+        Column("documents", Integer, nullable=False, default=0),
+        Column("config", Text),
+        Column("finished_at", DateTime, nullable=False)
+    )
+
+progress = _progress_table()
+REFERENCE_CHUNK = -1
+
+def _multiplier(n: int) -> int:
+    # Scatters popularity ranks over the id space so hot SKUs are not all
+    # clustered at the start of the catalogue (or in the same chunk).
+    m = max(int(n * 0.6180339887) | 1, 1)
+    while math.gcd(m, n) != 1:
+        m += 2
+    return m
+
+def product_weights(first: int, last: int, config: dict) -> list:
+    n = config["products"]
+    m = _multiplier(n)
+    return [1.0 / ((product_id * m) % n + 1) ** config["skew"] for product_id in range(first, last + 1)]
+
+def plan(config: dict) -> list:
+    n = config["products"]
+    weights = product_weights(1, n, config)
+    total = sum(weights)
+
+    chunks = []
+    cumulative = 0.0
+    assigned = 0
+    move_offset = document_offset = line_offset = 0
+    for index, first in enumerate(range(1, n + 1, config["chunk_products"])):
+        last = min(first + config["chunk_products"] - 1, n)
+        cumulative += sum(weights[first - 1:last])
+        moves = round(config["moves"] * cumulative / total) - assigned
+        assigned += moves
+        open_documents = moves // OPEN_DOCUMENT_RATIO + 1
+        # Every done line produces exactly one move, so id blocks sized from
+        # the move count are an upper bound and need no coordination between
+        # workers.
+        chunks.append({
+            "index": index,
+            "first_product": first,
+            "last_product": last,
+            "moves": moves,
+            "open_documents": open_documents,
+            "move_offset": move_offset,
+            "document_offset": document_offset,
+            "line_offset": line_offset
+        })
+        move_offset += moves
+        document_offset += moves + open_documents
+        line_offset += moves + open_documents * MAX_LINES
+    return chunks
+
+class Calendar:
+    def __init__(self, end: datetime, days: int):
+        self.start = (end - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.days = days
+        self.day_weights = list(accumulate(self._season(self.start + timedelta(days=d)) for d in range(days)))
+        self.hour_weights = list(accumulate(HOUR_PROFILE))
+
+    @staticmethod
+    def _season(day: datetime) -> float:
+        # A gentle yearly wave, a year-end peak and quiet weekends.
+        weight = 1.0 + 0.35 * math.sin(2 * math.pi * (day.timetuple().tm_yday - 80) / 365.25)
+        if day.month == 11 and day.day >= 20 or day.month == 12 and day.day <= 22:
+            weight *= 2.2
+        if day.weekday() >= 5:
+            weight *= 0.35
+        return weight
+
+    def sample(self, rng: random.Random) -> datetime:
+        day = bisect_right(self.day_weights, rng.random() * self.day_weights[-1])
+        hour = bisect_right(self.hour_weights, rng.random() * self.hour_weights[-1])
+        return self.start + timedelta(days=min(day, self.days - 1), hours=hour, seconds=rng.randrange(3600))
+
+def _chunk_locations(rng: random.Random, config: dict) -> list:
+    warehouses = config["warehouses"]
+    per_warehouse = config["locations"]
+    warehouse_weights = list(accumulate(1.0 / w ** 0.8 for w in range(1, warehouses + 1)))
+    locations = set()
+    for _ in range(LOCATIONS_PER_CHUNK):
+        warehouse_id = bisect_right(warehouse_weights, rng.random() * warehouse_weights[-1]) + 1
+        location_id = (warehouse_id - 1) * per_warehouse + rng.randint(1, per_warehouse)
+        locations.add((warehouse_id, location_id))
+    return sorted(locations)
+
+def generate_chunk(chunk: dict, config: dict, admin_id: int):
+    rng = random.Random(config["random_seed"] * 1000003 + chunk["index"])
+    calendar = Calendar(datetime.fromisoformat(config["end"]), config["days"])
+    products = list(range(chunk["first_product"], chunk["last_product"] + 1))
+    cum_weights = list(accumulate(product_weights(chunk["first_product"], chunk["last_product"], config)))
+    locations = _chunk_locations(rng, config)
+
+    sizes = []
+    remaining = chunk["moves"]
+    while remaining > 0:
+        size = min(rng.randint(1, MAX_LINES), remaining)
+        sizes.append(size)
+        remaining -= size
+    times = sorted(calendar.sample(rng) for _ in sizes)
+
+    documents, lines, moves = [], [], []
+    balances = {location: {} for location in locations}
+
+    def add_line(document_id, product_id, quantity):
+        lines.append((chunk["line_offset"] + len(lines) + 1, document_id, product_id, quantity))
+
+    planned = 0
+    for size, created_at in zip(sizes, times):
+        # Deliveries can only pick what is on hand and repeated hot SKUs
+        # collapse into one line, so carry any shortfall into later documents.
+        planned += size
+        size = min(planned - len(moves), MAX_LINES * 2)
+        warehouse_id, location_id = rng.choice(locations)
+        stock = balances[(warehouse_id, location_id)]
+        document_id = chunk["document_offset"] + len(documents) + 1
+        roll = rng.random()
+        in_stock = [product_id for product_id, quantity in stock.items() if quantity >= 1] if roll < 0.95 else []
+
+        if roll < 0.45 or not in_stock:
+            doc_type, picked = "RECEIPT", set(rng.choices(products, cum_weights=cum_weights, k=size))
+            quantities = [(product_id, float(rng.randint(10, 200))) for product_id in sorted(picked)]
+        elif roll < 0.9:
+            doc_type = "DELIVERY"
+            quantities = [
+                (product_id, float(rng.randint(1, min(int(stock[product_id]), 60))))
+                for product_id in sorted(rng.sample(in_stock, min(size, len(in_stock))))
+            ]
+        else:
+            doc_type = "ADJUSTMENT"
+            quantities = [
+                (product_id, float(-rng.randint(1, min(int(stock[product_id]), 10)) if rng.random() < 0.6 else rng.randint(1, 10)))
+                for product_id in sorted(rng.sample(in_stock, min(size, len(in_stock))))
+            ]
+
+        if doc_type == "DELIVERY":
+            sides = (warehouse_id, location_id, None, None)
+            partner = (None, f"Customer {rng.randint(1, 20000)}")
+        else:
+            sides = (None, None, warehouse_id, location_id)
+            partner = (f"Supplier {rng.randint(1, 2000)}", None) if doc_type == "RECEIPT" else (None, None)
+        documents.append(
+            (document_id, doc_type, "DONE") + sides + partner + (admin_id, created_at, created_at, created_at)
+        )
+        for product_id, quantity in quantities:
+            add_line(document_id, product_id, quantity)
+            moves.append(
+                (chunk["move_offset"] + len(moves) + 1, product_id) + sides + (quantity, doc_type, document_id, created_at)
+            )
+            delta = -quantity if doc_type == "DELIVERY" else quantity
+            stock[product_id] = stock.get(product_id, 0.0) + delta
+
+    # A sliver of recent, not yet validated documents so the open queues and
+    # validate endpoints have realistic work.
+    recent = calendar.start + timedelta(days=max(config["days"] - 14, 0))
+    for _ in range(chunk["open_documents"]):
+        warehouse_id, location_id = rng.choice(locations)
+        document_id = chunk["document_offset"] + len(documents) + 1
+        created_at = recent + timedelta(seconds=rng.randrange(14 * 86400))
+        if rng.random() < 0.5:
+            doc_type, sides, partner = "RECEIPT", (None, None, warehouse_id, location_id), (f"Supplier {rng.randint(1, 2000)}", None)
+        else:
+            doc_type, sides, partner = "DELIVERY", (warehouse_id, location_id, None, None), (None, f"Customer {rng.randint(1, 20000)}")
+        documents.append(
+            (document_id, doc_type, "READY") + sides + partner + (admin_id, created_at, created_at, None)
+        )
+        for product_id in sorted(set(rng.choices(products, cum_weights=cum_weights, k=rng.randint(1, MAX_LINES)))):
+            add_line(document_id, product_id, float(rng.randint(1, 20)))
+
+    levels = [
+        (product_id, warehouse_id, location_id, quantity)
+        for (warehouse_id, location_id), stock in balances.items()
+        for product_id, quantity in sorted(stock.items())
+    ]
+    return documents, lines, moves, levels
+
+def _load(connection, table: str, columns, rows):
+    if not rows:
+        return
+    if connection.dialect.name == "postgresql":
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+        finally:
+            cursor.close()
+        return
+
+    from sqlalchemy import insert
+
+    from database import Base
+
+    statement = insert(Base.metadata.tables[table])
+    for start in range(0, len(rows), BATCH_SIZE):
+        connection.execute(statement, [dict(zip(columns, row)) for row in rows[start:start + BATCH_SIZE]])
+
+_worker_engine = None
+
+def _init_worker(database_url: str):
+    global _worker_engine
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import NullPool
+
+    connect_args = {"timeout": 300} if database_url.startswith("sqlite") else {}
+    _worker_engine = create_engine(database_url, poolclass=NullPool, connect_args=connect_args)
+
+def run_chunk(job):
+    chunk, config, admin_id = job
+    started = time.perf_counter()
+    documents, lines, moves, levels = generate_chunk(chunk, config, admin_id)
+    with _worker_engine.begin() as connection:
+        _load(connection, "documents", DOCUMENT_COLUMNS, documents)
+        _load(connection, "document_lines", LINE_COLUMNS, lines)
+        _load(connection, "stock_moves", MOVE_COLUMNS, moves)
+        _load(connection, "stock_levels", LEVEL_COLUMNS, levels)
+        connection.execute(progress.insert().values(
+            chunk=chunk["index"], moves=len(moves), documents=len(documents), finished_at=datetime.utcnow()
+        ))
+    return chunk["index"], len(moves), len(documents), time.perf_counter() - started
+
+def load_reference(connection, config: dict):
+    rng = random.Random(config["random_seed"])
+    now = datetime.fromisoformat(config["end"])
+    per_warehouse = config["locations"]
+
+    _load(connection, "categories", ("id", "name"), list(enumerate(CATEGORIES, start=1)))
+    _load(connection, "warehouses", ("id", "name", "code", "address", "created_at", "updated_at"), [
+        (w, f"Warehouse {w}", f"WH/{w:03d}", f"{w} Capacity Road", now, now)
+        for w in range(1, config["warehouses"] + 1)
+    ])
+    _load(connection, "locations", ("id", "warehouse_id", "name", "code", "created_at", "updated_at"), [
+        ((w - 1) * per_warehouse + l, w, f"Aisle {l}", f"A{l:03d}", now, now)
+        for w in range(1, config["warehouses"] + 1)
+        for l in range(1, per_warehouse + 1)
+    ])
+    products = []
+    for p in range(1, config["products"] + 1):
+        products.append((
+            p, f"Product {p:07d}", f"SKU{p:07d}", rng.randint(1, len(CATEGORIES)), rng.choice(UOMS),
+            round(min(rng.lognormvariate(3.5, 1.3), 250000.0), 2), float(rng.choice((0, 5, 10, 20, 50, 100))),
+            True, now, now
+        ))
+        if len(products) == BATCH_SIZE * 10:
+            _load(connection, "products", PRODUCT_COLUMNS, products)
+            products = []
+    _load(connection, "products", PRODUCT_COLUMNS, products)
+
+def _deferred_indexes():
+    import models
+
+    return [
+        index
+        for table in (models.Document.__table__, models.DocumentLine.__table__, models.StockMove.__table__)
+        for index in table.indexes
+        if not index.unique
+    ]
+
+def _reset_sequences(connection):
+    from sqlalchemy import text
+
+    if connection.dialect.name != "postgresql":
+        return
+    for table in ("categories", "warehouses", "locations", "products", "documents", "document_lines", "stock_moves"):
+        connection.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE((SELECT max(id) FROM {table}), 1))"
+        ))
+
+def prepare(engine, args, config: dict):
+    """Returns the configuration of the run to continue, or None to refuse."""
+    from sqlalchemy import select
+
+    from database import Base, advisory_lock, create_schema
+
+    if args.reset:
+        progress.drop(engine, checkfirst=True)
+        Base.metadata.drop_all(bind=engine)
+    create_schema(engine)
+    progress.create(engine, checkfirst=True)
+
+    with engine.begin() as connection:
+        advisory_lock(connection, "generate")
+        stored = connection.scalar(select(progress.c.config).where(progress.c.chunk == REFERENCE_CHUNK))
+        if stored is not None:
+            stored = json.loads(stored)
+            changed = [key for key in CONFIG_KEYS if stored[key] != config[key]]
+            if changed:
+                print(f"Resuming a run with different {', '.join(changed)}; pass --reset to start over")
+                return None
+            return stored
+
+        if connection.scalar(select(1).select_from(Base.metadata.tables["products"]).limit(1)) is not None:
+            print("Database already has products; pass --reset to regenerate")
+            return None
+        load_reference(connection, config)
+        connection.execute(progress.insert().values(
+            chunk=REFERENCE_CHUNK, config=json.dumps(config), finished_at=datetime.utcnow()
+        ))
+    return config
+
+def finish(engine):
+    from sqlalchemy import select
+    from sqlalchemy.orm import Session
+
+    from database import create_schema
+    import crud
+    import models
+    import refcache
+    import search
+    import watermark
+
+    with engine.begin() as connection:
+        _reset_sequences(connection)
+    create_schema(engine)
+    with Session(engine) as db:
+        refcache.bump_version(db, refcache.REFERENCE_VERSION_KEY)
+        watermark.advance(db, db.scalars(select(models.Warehouse.id)).all())
+        crud.rebuild_kpi_counters(db)
+    with engine.begin() as connection:
+        search.create_search_indexes(connection)
+        connection.exec_driver_sql("ANALYZE")
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from sqlalchemy import select
+    from sqlalchemy.orm import Session
+
+    from database import engine
+    import demo_data
+
+    config = {key: getattr(args, key) for key in CONFIG_KEYS}
+    config["end"] = (args.end or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)).isoformat()
+    started = time.perf_counter()
+    config = prepare(engine, args, config)
+    if config is None:
+        return 1
+
+    with Session(engine) as db:
+        admin_id = demo_data.ensure_admin(db)
+        db.commit()
+        done = set(db.scalars(select(progress.c.chunk).where(progress.c.chunk != REFERENCE_CHUNK)))
+    chunks = [chunk for chunk in plan(config) if chunk["index"] not in done]
+    print(f"{len(done)} chunks already loaded, {len(chunks)} to go")
+
+    if args.defer_indexes and chunks:
+        with engine.begin() as connection:
+            for index in _deferred_indexes():
+                index.drop(connection, checkfirst=True)
+
+    # Workers open their own connections; do not let forked children inherit
+    # the parent's pooled ones.
+    engine.dispose()
+    loaded_moves = 0
+    with Pool(args.workers, initializer=_init_worker, initargs=(args.database_url,)) as pool:
+        jobs = ((chunk, config, admin_id) for chunk in chunks)
+        for count, (index, moves, documents, elapsed) in enumerate(pool.imap_unordered(run_chunk, jobs), start=1):
+            loaded_moves += moves
+            rate = loaded_moves / (time.perf_counter() - started)
+            print(f"chunk {index}: {moves} moves, {documents} documents in {elapsed:.1f}s "
+                  f"[{count}/{len(chunks)}, {rate:,.0f} moves/s]")
+
+    print("Rebuilding indexes, sequences and counters")
+    finish(engine)
+    print(f"Generated {config['products']} products, {config['warehouses'] * config['locations']} locations and "
+          f"{config['moves']} planned moves in {time.perf_counter() - started:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark StockMaster endpoints in-process")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL", "sqlite:///./benchmark.db"))
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per scenario")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed requests per scenario")
+    parser.add_argument("--scenario", action="append", help="Run only these scenarios (repeatable)")
+    parser.add_argument("--output", help="Write the JSON results to this file")
+    parser.add_argument("--compare", help="Print the change against an earlier JSON result")
+    return parser.parse_args(argv)
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+    def attach(self, *engines):
+        from sqlalchemy import event
+
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self)
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+class Scenario:
+    def __init__(self, name, request, prepare=None):
+        self.name = name
+        self.request = request
+        self.prepare = prepare
+
+def _ready_documents(doc_type):
+    def prepare(count):
+        from database import SessionLocal
+        import models
+
+        db = SessionLocal()
+        try:
+            return [
+                document_id for (document_id,) in db.query(models.Document.id).filter(
+                    models.Document.doc_type == doc_type,
+                    models.Document.status == models.DocStatus.READY,
+                    models.Document.lines.any()
+                ).order_by(models.Document.id.desc()).limit(count)
+            ]
+        finally:
+            db.close()
+    return prepare
+
+def _reference_ids():
+    from database import SessionLocal
+    import models
+
+    db = SessionLocal()
+    try:
+        location = db.query(models.Location).order_by(models.Location.id).first()
+        products = [product_id for (product_id,) in db.query(models.Product.id).order_by(models.Product.id).limit(3)]
+        level = db.query(models.StockLevel).filter(
+            models.StockLevel.quantity_on_hand >= 1
+        ).order_by(models.StockLevel.id).first()
+        return location, products, level
+    finally:
+        db.close()
+
+def build_scenarios():
+    import models
+
+    location, products, level = _reference_ids()
+    receipt_form = {
+        "supplier_name": "Benchmark Supplier",
+        "to_warehouse_id": location.warehouse_id,
+        "to_location_id": location.id,
+        "product_id[]": [str(product_id) for product_id in products],
+        "quantity[]": ["5"] * len(products)
+    }
+
+    scenarios = [
+        Scenario("dashboard", lambda client, i, arg: client.get("/dashboard")),
+        Scenario("stock", lambda client, i, arg: client.get("/stock")),
+        Scenario("stock_search", lambda client, i, arg: client.get("/stock", params={"search": f"{i % 1000:03d}"})),
+        Scenario("products", lambda client, i, arg: client.get("/products")),
+        Scenario("moves", lambda client, i, arg: client.get("/operations/moves")),
+        Scenario("moves_by_location", lambda client, i, arg: client.get(
+            "/operations/moves", params={"location_id": location.id}
+        )),
+        Scenario("receipts_open", lambda client, i, arg: client.get("/operations/receipts", params={"status": "open"})),
+        Scenario("receipt_form", lambda client, i, arg: client.get("/operations/receipts/new")),
+        Scenario("create_receipt", lambda client, i, arg: client.post("/operations/receipts/new", data=receipt_form)),
+        Scenario(
+            "validate_receipt",
+            lambda client, i, document_id: client.post(f"/operations/receipts/{document_id}/validate"),
+            _ready_documents(models.DocType.RECEIPT)
+        ),
+        Scenario(
+            "validate_delivery",
+            lambda client, i, document_id: client.post(f"/operations/deliveries/{document_id}/validate"),
+            _ready_documents(models.DocType.DELIVERY)
+        ),
+        Scenario(
+            "validate_adjustment",
+            lambda client, i, document_id: client.post(f"/operations/adjustments/{document_id}/validate"),
+            _ready_documents(models.DocType.ADJUSTMENT)
+        ),
+        Scenario("valuation", lambda client, i, arg: client.get("/reports/valuation")),
+        Scenario("api_stock", lambda client, i, arg: client.get("/api/v1/stock")),
+        Scenario("api_stock_locations", lambda client, i, arg: client.get("/api/v1/stock/locations")),
+        Scenario("api_documents_open", lambda client, i, arg: client.get(
+            "/api/v1/documents", params={"doc_type": "RECEIPT", "status": "open", "limit": 50}
+        )),
+        Scenario("api_moves", lambda client, i, arg: client.get("/api/v1/moves", params={"limit": 100})),
+    ]
+    if level is not None:
+        scenarios.append(Scenario("stock_update", lambda client, i, arg: client.post(
+            "/stock/update", data={"product_id": level.product_id, "adjustment": "-1" if i % 2 else "1"}
+        )))
+    return scenarios
+
+def _failed(response):
+    if response.status_code >= 400:
+        return True
+    return "error=" in response.headers.get("location", "")
+
+def run_scenario(client, counter, scenario, requests, warmup):
+    args = [None] * (requests + warmup)
+    if scenario.prepare:
+        args = scenario.prepare(requests + warmup)
+        if len(args) < requests + warmup:
+            return {"skipped": f"needs {requests + warmup} open documents, found {len(args)}"}
+
+    for i in range(warmup):
+        scenario.request(client, i, args[i])
+
+    latencies = []
+    queries = 0
+    errors = 0
+    started = time.perf_counter()
+    for i in range(warmup, warmup + requests):
+        counter.count = 0
+        request_started = time.perf_counter()
+        response = scenario.request(client, i, args[i])
+        latencies.append(time.perf_counter() - request_started)
+        queries += counter.count
+        errors += _failed(response)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "queries_per_request": round(queries / requests, 2),
+        "throughput_rps": round(requests / elapsed, 1)
+    }
+
+def dataset_summary():
+    from database import SessionLocal, engine
+    import models
+
+    db = SessionLocal()
+    try:
+        return {
+            "dialect": engine.dialect.name,
+            "products": db.query(models.Product).count(),
+            "locations": db.query(models.Location).count(),
+            "stock_levels": db.query(models.StockLevel).count(),
+            "stock_moves": db.query(models.StockMove).count(),
+            "documents": db.query(models.Document).count()
+        }
+    finally:
+        db.close()
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+    print(f"\n{'scenario':<22}{'p50':>12}{'p95':>12}{'p99':>12}{'queries':>12}")
+    for name, result in results["scenarios"].items():
+        before = baseline.get(name)
+        if not before or "skipped" in result or "skipped" in before:
+            continue
+        cells = []
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (result[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0.0
+            cells.append(f"{change:+.1f}%")
+        cells.append(f"{result['queries_per_request'] - before['queries_per_request']:+.2f}")
+        print(f"{name:<22}" + "".join(f"{cell:>12}" for cell in cells))
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ["DATABASE_URL"] = args.database_url
+    os.chdir(ROOT)
+
+    from fastapi.testclient import TestClient
+    from database import async_engine, engine
+    import app as application
+
+    counter = QueryCounter()
+    counter.attach(engine, async_engine.sync_engine)
+
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "dataset": dataset_summary()
+        },
+        "scenarios": {}
+    }
+
+    with TestClient(application.app) as client:
+        response = client.post(
+            "/login", data={"email": "admin@example.com", "password": "admin123"}, follow_redirects=False
+        )
+        if response.status_code != 302:
+            print("Could not sign in as admin@example.com")
+            return 1
+        client.follow_redirects = False
+
+        for scenario in build_scenarios():
+            if args.scenario and scenario.name not in args.scenario:
+                continue
+            result = run_scenario(client, counter, scenario, args.requests, args.warmup)
+            results["scenarios"][scenario.name] = result
+            if "skipped" in result:
+                print(f"{scenario.name:<22} skipped: {result['skipped']}")
+            else:
+                print(
+                    f"{scenario.name:<22} p50 {result['p50_ms']:>9.2f}ms  p95 {result['p95_ms']:>9.2f}ms  "
+                    f"p99 {result['p99_ms']:>9.2f}ms  {result['queries_per_request']:>6.2f} q/req  "
+                    f"{result['throughput_rps']:>8.1f} req/s  {result['errors']} errors"
+                )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
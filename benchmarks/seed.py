@@ -0,0 +1,191 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BATCH_SIZE = 10000
+CATEGORIES = ["Electronics", "Furniture", "Office Supplies", "Hardware", "Packaging", "Consumables"]
+UOMS = ["Units", "Box", "Ream", "Kg", "Pack"]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Seed a synthetic StockMaster dataset for benchmarking")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL", "sqlite:///./benchmark.db"))
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--warehouses", type=int, default=5)
+    parser.add_argument("--locations", type=int, default=10, help="Locations per warehouse")
+    parser.add_argument("--moves", type=int, default=1000000)
+    parser.add_argument("--documents", type=int, default=2000, help="Open documents per type")
+    parser.add_argument("--days", type=int, default=365, help="Spread move timestamps over this many days")
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="Drop and recreate all tables first")
+    return parser.parse_args(argv)
+
+def _insert(db, model, rows):
+    from sqlalchemy import insert
+
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.execute(insert(model), rows[start:start + BATCH_SIZE])
+    db.commit()
+
+def seed(db, args):
+    import auth
+    import crud
+    import models
+
+    rng = random.Random(args.random_seed)
+    now = datetime.utcnow().replace(microsecond=0)
+
+    admin = db.query(models.User).filter(models.User.email == "admin@example.com").first()
+    if not admin:
+        admin = models.User(
+            name="Admin User",
+            email="admin@example.com",
+            password_hash=auth.get_password_hash("admin123"),
+            role=models.UserRole.ADMIN
+        )
+        db.add(admin)
+        db.commit()
+
+    _insert(db, models.Category, [{"name": name} for name in CATEGORIES])
+    category_ids = [category_id for (category_id,) in db.query(models.Category.id)]
+
+    _insert(db, models.Warehouse, [
+        {"name": f"Warehouse {w}", "code": f"WH/{w:03d}", "address": f"{w} Benchmark Road"}
+        for w in range(1, args.warehouses + 1)
+    ])
+    warehouse_ids = [warehouse_id for (warehouse_id,) in db.query(models.Warehouse.id).order_by(models.Warehouse.id)]
+
+    _insert(db, models.Location, [
+        {"warehouse_id": warehouse_id, "name": f"Zone {l}", "code": f"Z{l:03d}"}
+        for warehouse_id in warehouse_ids
+        for l in range(1, args.locations + 1)
+    ])
+    locations = db.query(models.Location.id, models.Location.warehouse_id).order_by(models.Location.id).all()
+
+    _insert(db, models.Product, [
+        {
+            "name": f"Product {p:07d}",
+            "sku": f"SKU{p:07d}",
+            "category_id": rng.choice(category_ids),
+            "uom": rng.choice(UOMS),
+            "cost": round(rng.uniform(1, 5000), 2),
+            "reorder_level": rng.randint(0, 50),
+            "is_active": True,
+            "created_at": now,
+            "updated_at": now
+        }
+        for p in range(1, args.products + 1)
+    ])
+    product_ids = [product_id for (product_id,) in db.query(models.Product.id).order_by(models.Product.id)]
+
+    # Moves are generated in time order against a running balance so that
+    # deliveries never take a location negative and the final balances are
+    # exactly the stock levels.
+    balances = {}
+    start = now - timedelta(days=args.days)
+    step = timedelta(days=args.days) / max(args.moves, 1)
+    batch = []
+    for m in range(args.moves):
+        product_id = rng.choice(product_ids)
+        location_id, warehouse_id = rng.choice(locations)
+        key = (product_id, warehouse_id, location_id)
+        on_hand = balances.get(key, 0.0)
+        move = {
+            "product_id": product_id,
+            "quantity": float(rng.randint(1, 100)),
+            "created_at": start + step * m
+        }
+        if on_hand >= 1 and rng.random() < 0.4:
+            move["quantity"] = float(rng.randint(1, int(on_hand)))
+            move.update(from_warehouse_id=warehouse_id, from_location_id=location_id, move_type=models.MoveType.DELIVERY)
+            balances[key] = on_hand - move["quantity"]
+        else:
+            move.update(to_warehouse_id=warehouse_id, to_location_id=location_id, move_type=models.MoveType.RECEIPT)
+            balances[key] = on_hand + move["quantity"]
+        batch.append(move)
+        if len(batch) == BATCH_SIZE:
+            _insert(db, models.StockMove, batch)
+            batch = []
+    if batch:
+        _insert(db, models.StockMove, batch)
+
+    _insert(db, models.StockLevel, [
+        {"product_id": product_id, "warehouse_id": warehouse_id, "location_id": location_id, "quantity_on_hand": quantity}
+        for (product_id, warehouse_id, location_id), quantity in sorted(balances.items())
+    ])
+
+    stocked = sorted(key for key, quantity in balances.items() if quantity >= 10)
+    for doc_type in (models.DocType.RECEIPT, models.DocType.DELIVERY, models.DocType.ADJUSTMENT):
+        documents = []
+        lines = []
+        for d in range(args.documents):
+            if stocked:
+                product_id, warehouse_id, location_id = rng.choice(stocked)
+            else:
+                product_id = rng.choice(product_ids)
+                location_id, warehouse_id = rng.choice(locations)
+            document = {
+                "doc_type": doc_type,
+                "status": models.DocStatus.READY,
+                "created_by": admin.id,
+                "created_at": start + timedelta(days=args.days) * rng.random()
+            }
+            if doc_type == models.DocType.DELIVERY:
+                document.update(customer_name=f"Customer {d}", from_warehouse_id=warehouse_id, from_location_id=location_id)
+            else:
+                document.update(supplier_name=f"Supplier {d}", to_warehouse_id=warehouse_id, to_location_id=location_id)
+            documents.append(document)
+            lines.append((product_id, float(rng.randint(1, 5))))
+
+        first_id = (db.query(models.Document.id).order_by(models.Document.id.desc()).limit(1).scalar() or 0) + 1
+        _insert(db, models.Document, documents)
+        document_ids = [
+            document_id for (document_id,) in db.query(models.Document.id).filter(
+                models.Document.id >= first_id
+            ).order_by(models.Document.id)
+        ]
+        _insert(db, models.DocumentLine, [
+            {"document_id": document_id, "product_id": product_id, "quantity": quantity}
+            for document_id, (product_id, quantity) in zip(document_ids, lines)
+        ])
+
+    crud.rebuild_kpi_counters(db)
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ["DATABASE_URL"] = args.database_url
+
+    from database import Base, SessionLocal, create_schema, engine
+    import models
+    import search
+
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+    create_schema()
+
+    db = SessionLocal()
+    try:
+        if db.query(models.Product.id).first() is not None:
+            print("Database already has products; pass --reset to reseed")
+            return 1
+        started = time.perf_counter()
+        seed(db, args)
+        # Same trigram and prefix indexes as init-db, built after the bulk
+        # load, so search scenarios measure the production plan.
+        with engine.begin() as connection:
+            if search.create_search_indexes(connection):
+                connection.exec_driver_sql("ANALYZE products")
+        print(
+            f"Seeded {args.products} products, {args.warehouses * args.locations} locations, "
+            f"{args.moves} moves and {args.documents * 3} documents in {time.perf_counter() - started:.1f}s"
+        )
+        return 0
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,247 +1,704 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+import base64
+import math
+import os
+import random
+import time
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import func, insert, or_, select, text, tuple_
+from sqlalchemy.exc import DBAPIError
 import models
+from database import insert_for
+from search import search_product_ids
+import events
+import watermark
 from datetime import datetime
 
-def get_dashboard_kpis(db: Session):
-    total_products = db.query(models.Product).filter(models.Product.is_active == True).count()
-    
-    low_stock_subquery = db.query(
-        models.StockLevel.product_id,
-        func.sum(models.StockLevel.quantity_on_hand).label('total_stock')
-    ).group_by(models.StockLevel.product_id).subquery()
-    
-    low_stock_items = db.query(models.Product).join(
-        low_stock_subquery,
-        models.Product.id == low_stock_subquery.c.product_id
+STOCK_LOCKING = os.getenv("STOCK_LOCKING", "true").lower() in ("1", "true", "yes")
+VALIDATION_RETRIES = int(os.getenv("VALIDATION_RETRIES", "3"))
+VALIDATION_ISOLATION_LEVEL = os.getenv("VALIDATION_ISOLATION_LEVEL")
+VALIDATION_BATCH_LIMIT = int(os.getenv("VALIDATION_BATCH_LIMIT", "500"))
+KPI_COUNTER_SLOTS = max(1, int(os.getenv("KPI_COUNTER_SLOTS", "8")))
+
+RETRYABLE_SQLSTATES = {"40001", "40P01"}
+
+OPEN_STATUSES = models.OPEN_STATUSES
+
+def _document_counter_key(doc_type: models.DocType, status: models.DocStatus) -> str:
+    return f"documents.{doc_type.value}.{status.value}"
+
+def _document_counter_keys(doc_type: models.DocType, statuses=models.DocStatus) -> list:
+    return [_document_counter_key(doc_type, status) for status in statuses]
+
+# Counter keys summed into each dashboard figure; the live dashboard applies
+# counter deltas from change events with the same mapping.
+KPI_COUNTERS = {
+    "total_products": ["products.active"],
+    "low_stock_items": ["products.low_stock"],
+    "pending_receipts": _document_counter_keys(models.DocType.RECEIPT, OPEN_STATUSES),
+    "total_receipts": _document_counter_keys(models.DocType.RECEIPT),
+    "late_receipts": [],
+    "pending_deliveries": _document_counter_keys(models.DocType.DELIVERY, OPEN_STATUSES),
+    "total_deliveries": _document_counter_keys(models.DocType.DELIVERY),
+    "waiting_deliveries": _document_counter_keys(models.DocType.DELIVERY, [models.DocStatus.WAITING]),
+    "internal_transfers": _document_counter_keys(models.DocType.TRANSFER, [models.DocStatus.WAITING, models.DocStatus.READY])
+}
+
+def _counter_slot_key(key: str, slot: int) -> str:
+    return key if slot == 0 else f"{key}#{slot}"
+
+def fold_counters(rows) -> dict:
+    counters = {}
+    for key, value in rows:
+        key = key.partition("#")[0]
+        counters[key] = counters.get(key, 0) + value
+    return counters
+
+def counters_statement():
+    return select(models.KpiCounter.key, models.KpiCounter.value)
+
+def bump_counters(db: Session, deltas: dict):
+    # Each transaction adds its deltas to one of KPI_COUNTER_SLOTS rows per
+    # counter, picked at random, so concurrent writers rarely wait on the
+    # same row; rows are upserted in key order so those that do cannot
+    # deadlock. Readers sum the slots back together.
+    slot = random.randrange(KPI_COUNTER_SLOTS)
+    rows = sorted(
+        ({"key": _counter_slot_key(key, slot), "value": value} for key, value in deltas.items() if value),
+        key=lambda row: row["key"]
+    )
+    if not rows:
+        return
+    events.record_counters(db, deltas)
+    
+    stmt = insert_for(db)(models.KpiCounter).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.KpiCounter.key],
+        set_={"value": models.KpiCounter.value + stmt.excluded.value}
+    )
+    db.execute(stmt)
+
+def count_document(db: Session, doc_type: models.DocType, old_status, new_status):
+    deltas = {}
+    if old_status is not None:
+        deltas[_document_counter_key(doc_type, old_status)] = -1
+    if new_status is not None:
+        key = _document_counter_key(doc_type, new_status)
+        deltas[key] = deltas.get(key, 0) + 1
+    bump_counters(db, deltas)
+
+def _low_stock_query(db: Session):
+    return db.query(models.Product.id).join(
+        models.StockLevel,
+        models.Product.id == models.StockLevel.product_id
     ).filter(
-        low_stock_subquery.c.total_stock < models.Product.reorder_level,
         models.Product.reorder_level > 0
-    ).count()
-    
-    pending_receipts = db.query(models.Document).filter(
-        models.Document.doc_type == models.DocType.RECEIPT,
-        models.Document.status.notin_([models.DocStatus.DONE, models.DocStatus.CANCELED])
-    ).count()
-    
-    total_receipts = db.query(models.Document).filter(
-        models.Document.doc_type == models.DocType.RECEIPT
-    ).count()
-    
-    late_receipts = 0
-    
-    pending_deliveries = db.query(models.Document).filter(
-        models.Document.doc_type == models.DocType.DELIVERY,
-        models.Document.status.notin_([models.DocStatus.DONE, models.DocStatus.CANCELED])
-    ).count()
-    
-    total_deliveries = db.query(models.Document).filter(
-        models.Document.doc_type == models.DocType.DELIVERY
-    ).count()
-    
-    waiting_deliveries = db.query(models.Document).filter(
-        models.Document.doc_type == models.DocType.DELIVERY,
-        models.Document.status == models.DocStatus.WAITING
-    ).count()
-    
-    internal_transfers = db.query(models.Document).filter(
-        models.Document.doc_type == models.DocType.TRANSFER,
-        models.Document.status.in_([models.DocStatus.WAITING, models.DocStatus.READY])
-    ).count()
-    
-    return {
-        "total_products": total_products,
-        "low_stock_items": low_stock_items,
-        "pending_receipts": pending_receipts,
-        "total_receipts": total_receipts,
-        "late_receipts": late_receipts,
-        "pending_deliveries": pending_deliveries,
-        "total_deliveries": total_deliveries,
-        "waiting_deliveries": waiting_deliveries,
-        "internal_transfers": internal_transfers
-    }
-
-def get_recent_operations(db: Session, limit: int = 10):
-    return db.query(models.Document).order_by(
-        models.Document.created_at.desc()
-    ).limit(limit).all()
+    ).group_by(
+        models.Product.id, models.Product.reorder_level
+    ).having(
+        func.sum(models.StockLevel.quantity_on_hand) < models.Product.reorder_level
+    )
 
-def validate_receipt(db: Session, document_id: int):
-    document = db.query(models.Document).filter(models.Document.id == document_id).first()
-    if not document:
-        raise ValueError("Document not found")
+def refresh_low_stock(db: Session, product_ids):
+    product_ids = set(product_ids)
+    if not product_ids:
+        return
+    
+    low = {row.id for row in _low_stock_query(db).filter(models.Product.id.in_(product_ids))}
+    flagged = {
+        row.product_id for row in db.query(models.LowStockProduct.product_id).filter(
+            models.LowStockProduct.product_id.in_(product_ids)
+        )
+    }
     
-    if document.status == models.DocStatus.DONE:
-        raise ValueError("Document already validated")
+    added = 0
+    if low - flagged:
+        stmt = insert_for(db)(models.LowStockProduct).values(
+            [{"product_id": product_id} for product_id in low - flagged]
+        ).on_conflict_do_nothing(index_elements=[models.LowStockProduct.product_id])
+        added = db.execute(stmt).rowcount
     
-    if document.status == models.DocStatus.CANCELED:
-        raise ValueError("Cannot validate a canceled document")
+    removed = 0
+    if flagged - low:
+        removed = db.query(models.LowStockProduct).filter(
+            models.LowStockProduct.product_id.in_(flagged - low)
+        ).delete(synchronize_session=False)
     
-    if not document.lines or len(document.lines) == 0:
-        raise ValueError("Document has no line items")
+    bump_counters(db, {"products.low_stock": added - removed})
+
+def compute_kpi_counters(db: Session):
+    counters = {
+        _document_counter_key(doc_type, doc_status): 0
+        for doc_type in models.DocType
+        for doc_status in models.DocStatus
+    }
     
-    for line in document.lines:
-        stock_level = db.query(models.StockLevel).filter(
-            models.StockLevel.product_id == line.product_id,
-            models.StockLevel.warehouse_id == document.to_warehouse_id,
-            models.StockLevel.location_id == document.to_location_id
-        ).first()
-        
-        if stock_level:
-            stock_level.quantity_on_hand += line.quantity
-        else:
-            stock_level = models.StockLevel(
-                product_id=line.product_id,
-                warehouse_id=document.to_warehouse_id,
-                location_id=document.to_location_id,
-                quantity_on_hand=line.quantity
-            )
-            db.add(stock_level)
-        
-        stock_move = models.StockMove(
-            product_id=line.product_id,
-            from_warehouse_id=None,
-            from_location_id=None,
-            to_warehouse_id=document.to_warehouse_id,
-            to_location_id=document.to_location_id,
-            quantity=line.quantity,
-            move_type=models.MoveType.RECEIPT,
-            document_id=document.id
+    document_counts = db.query(
+        models.Document.doc_type,
+        models.Document.status,
+        func.count(models.Document.id)
+    ).group_by(models.Document.doc_type, models.Document.status).all()
+    for doc_type, doc_status, count in document_counts:
+        counters[_document_counter_key(doc_type, doc_status or models.DocStatus.DRAFT)] += count
+    
+    counters["products.active"] = db.query(models.Product).filter(models.Product.is_active == True).count()
+    low_stock_ids = [row.id for row in _low_stock_query(db)]
+    counters["products.low_stock"] = len(low_stock_ids)
+    
+    return counters, low_stock_ids
+
+def rebuild_kpi_counters(db: Session):
+    counters, low_stock_ids = compute_kpi_counters(db)
+    
+    db.query(models.LowStockProduct).delete(synchronize_session=False)
+    if low_stock_ids:
+        db.execute(
+            models.LowStockProduct.__table__.insert(),
+            [{"product_id": product_id} for product_id in low_stock_ids]
         )
-        db.add(stock_move)
     
-    document.status = models.DocStatus.DONE
-    document.validated_at = datetime.utcnow()
+    db.query(models.KpiCounter).delete(synchronize_session=False)
+    db.execute(
+        models.KpiCounter.__table__.insert(),
+        [{"key": key, "value": value} for key, value in counters.items()]
+    )
+    watermark.advance(db)
     db.commit()
     
-    return document
+    return counters
 
-def get_stock_summary(db: Session, search: str = None):
-    query = db.query(
+def kpis_from_counters(counters: dict):
+    return {name: sum(counters.get(key, 0) for key in keys) for name, keys in KPI_COUNTERS.items()}
+
+def get_dashboard_kpis(db: Session):
+    return kpis_from_counters(fold_counters(db.execute(counters_statement())))
+
+def recent_operations_statement(limit: int = 10):
+    return select(models.Document).order_by(
+        models.Document.created_at.desc()
+    ).limit(limit)
+
+def get_recent_operations(db: Session, limit: int = 10):
+    return db.execute(recent_operations_statement(limit)).scalars().all()
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+def paginate(rows: list, limit: int):
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+def filter_stock_moves(
+    stmt,
+    cursor: str = None,
+    product_id: int = None,
+    warehouse_id: int = None,
+    location_id: int = None,
+    move_type: models.MoveType = None,
+    date_from: datetime = None,
+    date_to: datetime = None
+):
+    if product_id:
+        stmt = stmt.where(models.StockMove.product_id == product_id)
+    if warehouse_id:
+        stmt = stmt.where(or_(
+            models.StockMove.from_warehouse_id == warehouse_id,
+            models.StockMove.to_warehouse_id == warehouse_id
+        ))
+    if location_id:
+        stmt = stmt.where(or_(
+            models.StockMove.from_location_id == location_id,
+            models.StockMove.to_location_id == location_id
+        ))
+    if move_type:
+        stmt = stmt.where(models.StockMove.move_type == move_type)
+    if date_from:
+        stmt = stmt.where(models.StockMove.created_at >= date_from)
+    if date_to:
+        stmt = stmt.where(models.StockMove.created_at < date_to)
+    if cursor:
+        created_at, move_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(models.StockMove.created_at, models.StockMove.id) < tuple_(created_at, move_id)
+        )
+    
+    return stmt.order_by(
+        models.StockMove.created_at.desc(),
+        models.StockMove.id.desc()
+    )
+
+def stock_moves_statement(limit: int = 100, cursor: str = None, **filters):
+    stmt = select(models.StockMove).options(
+        joinedload(models.StockMove.product),
+        joinedload(models.StockMove.from_warehouse),
+        joinedload(models.StockMove.from_location),
+        joinedload(models.StockMove.to_warehouse),
+        joinedload(models.StockMove.to_location)
+    )
+    return filter_stock_moves(stmt, cursor, **filters).limit(limit + 1)
+
+def get_stock_moves(db: Session, limit: int = 100, cursor: str = None, **filters):
+    moves = db.execute(stock_moves_statement(limit, cursor, **filters)).scalars().all()
+    return paginate(moves, limit)
+
+def filter_documents(stmt, doc_type: models.DocType = None, statuses: list = None, cursor: str = None):
+    if doc_type:
+        stmt = stmt.where(models.Document.doc_type == doc_type)
+    if statuses and set(statuses) == set(OPEN_STATUSES):
+        # Spelled exactly like the partial index predicate, with inline
+        # literals, so the planner can serve it from that index in order.
+        stmt = stmt.where(text(f"documents.{models.OPEN_STATUS_FILTER}"))
+    elif statuses:
+        stmt = stmt.where(models.Document.status.in_(statuses))
+    if cursor:
+        created_at, document_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            tuple_(models.Document.created_at, models.Document.id) < tuple_(created_at, document_id)
+        )
+    
+    return stmt.order_by(
+        models.Document.created_at.desc(),
+        models.Document.id.desc()
+    )
+
+def documents_statement(
+    doc_type: models.DocType,
+    statuses: list = None,
+    cursor: str = None,
+    limit: int = 50
+):
+    stmt = select(models.Document).options(selectinload(models.Document.lines))
+    return filter_documents(stmt, doc_type, statuses, cursor).limit(limit + 1)
+
+def list_documents(
+    db: Session,
+    doc_type: models.DocType,
+    statuses: list = None,
+    cursor: str = None,
+    limit: int = 50
+):
+    documents = db.execute(documents_statement(doc_type, statuses, cursor, limit)).scalars().all()
+    return paginate(documents, limit)
+
+def stock_summary_statement(product_ids: list = None):
+    stmt = select(
         models.Product,
         func.sum(models.StockLevel.quantity_on_hand).label('total_quantity')
     ).join(
         models.StockLevel,
         models.Product.id == models.StockLevel.product_id,
         isouter=True
-    ).group_by(models.Product.id).filter(
+    ).group_by(models.Product.id).where(
         models.Product.is_active == True
     )
     
-    if search:
-        query = query.filter(
-            (models.Product.name.ilike(f"%{search}%")) |
-            (models.Product.sku.ilike(f"%{search}%"))
-        )
-    
-    results = query.all()
+    if product_ids is not None:
+        stmt = stmt.where(models.Product.id.in_(product_ids))
     
-    stock_items = []
-    for product, total_qty in results:
-        stock_items.append({
+    return stmt
+
+def stock_items(results, product_ids: list = None):
+    items = [
+        {
             'product': product,
             'total_quantity': total_qty or 0.0
-        })
+        }
+        for product, total_qty in results
+    ]
+    if product_ids is not None:
+        rank = {product_id: position for position, product_id in enumerate(product_ids)}
+        items.sort(key=lambda item: rank[item['product'].id])
+    return items
+
+def get_stock_summary(db: Session, search: str = None):
+    product_ids = search_product_ids(db, search) if search else None
+    return stock_items(db.execute(stock_summary_statement(product_ids)).all(), product_ids)
+
+DOCUMENT_SIDES = {
+    models.DocType.RECEIPT: ("to",),
+    models.DocType.DELIVERY: ("from",),
+    models.DocType.TRANSFER: ("from", "to"),
+    models.DocType.ADJUSTMENT: ("to",)
+}
+
+def prepare_document(reference, doc_type: models.DocType, header: dict, lines: list):
+    values = {
+        "doc_type": doc_type,
+        "status": models.DocStatus.READY,
+        "supplier_name": header.get("supplier_name") or None,
+        "customer_name": header.get("customer_name") or None
+    }
+    for side in DOCUMENT_SIDES[doc_type]:
+        label = "source" if side == "from" else "destination"
+        warehouse_id = header.get(f"{side}_warehouse_id")
+        location_id = header.get(f"{side}_location_id")
+        if warehouse_id is None or location_id is None:
+            raise ValueError(f"A {label} warehouse and location are required")
+        location = reference.locations_by_id.get(location_id)
+        if location is None or location.warehouse_id != warehouse_id:
+            raise ValueError(f"Unknown {label} location for warehouse {warehouse_id}")
+        values[f"{side}_warehouse_id"] = warehouse_id
+        values[f"{side}_location_id"] = location.id
+    
+    if doc_type == models.DocType.TRANSFER and values["from_location_id"] == values["to_location_id"]:
+        raise ValueError("Source and destination locations must differ")
+    if not lines:
+        raise ValueError("Document has no line items")
+    for product_id, quantity in lines:
+        if product_id not in reference.products_by_id:
+            raise ValueError(f"Unknown product {product_id}")
+        if not math.isfinite(quantity) or quantity == 0 or (quantity < 0 and doc_type != models.DocType.ADJUSTMENT):
+            raise ValueError(f"Invalid quantity {quantity:g} for product {reference.products_by_id[product_id].name}")
+    
+    return values, lines
+
+def create_document(db: Session, values: dict, lines: list, created_by: int) -> int:
+    document_id, created_at = db.execute(
+        insert(models.Document).values(created_by=created_by, **values).returning(
+            models.Document.id, models.Document.created_at
+        )
+    ).one()
+    db.execute(insert(models.DocumentLine).values([
+        {"document_id": document_id, "product_id": product_id, "quantity": quantity}
+        for product_id, quantity in lines
+    ]))
+    watermark.advance(db, (values.get("from_warehouse_id"), values.get("to_warehouse_id")))
+    count_document(db, values["doc_type"], None, values["status"])
+    events.record_document(
+        db, document_id, values["doc_type"], values["status"],
+        values["supplier_name"] or values["customer_name"], created_at
+    )
+    db.commit()
+    return document_id
+
+def _is_retryable(error: DBAPIError) -> bool:
+    return getattr(error.orig, "pgcode", None) in RETRYABLE_SQLSTATES
+
+def _begin_validation(db: Session):
+    if VALIDATION_ISOLATION_LEVEL:
+        # Execution options only reach a newly checked-out connection, so end
+        # whatever the request's session already started (such as the user
+        # lookup) before opening the validation transaction.
+        if db.in_transaction():
+            db.commit()
+        db.connection(execution_options={"isolation_level": VALIDATION_ISOLATION_LEVEL})
+
+def run_attempt(db: Session, operation, *args, **kwargs):
+    _begin_validation(db)
+    try:
+        return operation(db, *args, **kwargs)
+    except (ValueError, DBAPIError):
+        db.rollback()
+        raise
+
+def retry_delay(error: DBAPIError, attempt: int):
+    # Seconds to back off before retrying a failed attempt, or None when the
+    # error is final. Async callers sleep on the event loop instead of here.
+    if attempt == VALIDATION_RETRIES or not _is_retryable(error):
+        return None
+    return random.uniform(0, 0.05 * 2 ** attempt)
+
+def run_with_retries(db: Session, operation, *args, **kwargs):
+    for attempt in range(VALIDATION_RETRIES + 1):
+        try:
+            return run_attempt(db, operation, *args, **kwargs)
+        except DBAPIError as e:
+            delay = retry_delay(e, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+
+def _product_name(db: Session, product_id: int) -> str:
+    name = db.query(models.Product.name).filter(models.Product.id == product_id).scalar()
+    return name or f"#{product_id}"
+
+def _load_stock_levels(db: Session, keys, lock: bool = False):
+    keys = sorted(keys)
+    if not keys:
+        return {}
     
-    return stock_items
+    query = db.query(
+        models.StockLevel.product_id,
+        models.StockLevel.warehouse_id,
+        models.StockLevel.location_id,
+        models.StockLevel.quantity_on_hand
+    ).filter(
+        tuple_(
+            models.StockLevel.product_id,
+            models.StockLevel.warehouse_id,
+            models.StockLevel.location_id
+        ).in_(keys)
+    ).order_by(
+        models.StockLevel.product_id,
+        models.StockLevel.warehouse_id,
+        models.StockLevel.location_id
+    )
+    if lock:
+        query = query.with_for_update()
+    
+    return {(row[0], row[1], row[2]): row[3] or 0.0 for row in query.all()}
+
+def _plan_stock_moves(moves: list):
+    deltas = {}
+    debited = set()
+    for move in moves:
+        if move.get("from_warehouse_id") is not None:
+            key = (move["product_id"], move["from_warehouse_id"], move["from_location_id"])
+            deltas[key] = deltas.get(key, 0.0) - move["quantity"]
+            debited.add(key)
+        if move.get("to_warehouse_id") is not None:
+            key = (move["product_id"], move["to_warehouse_id"], move["to_location_id"])
+            deltas[key] = deltas.get(key, 0.0) + move["quantity"]
+    return deltas, debited
+
+def _check_stock(db: Session, levels: dict, deltas: dict, debited: set):
+    for key in sorted(debited):
+        if key not in levels:
+            raise ValueError(f"No stock found for product {_product_name(db, key[0])}")
+        if levels[key] + deltas[key] < 0:
+            raise ValueError(f"Insufficient stock for product {_product_name(db, key[0])}")
+
+def _flush_stock_moves(db: Session, deltas: dict, moves: list):
+    # RETURNING gives the post-update quantities for the change events.
+    if deltas:
+        stmt = insert_for(db)(models.StockLevel).values([
+            {
+                "product_id": key[0],
+                "warehouse_id": key[1],
+                "location_id": key[2],
+                "quantity_on_hand": delta
+            }
+            for key, delta in sorted(deltas.items())
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                models.StockLevel.product_id,
+                models.StockLevel.warehouse_id,
+                models.StockLevel.location_id
+            ],
+            set_={"quantity_on_hand": models.StockLevel.quantity_on_hand + stmt.excluded.quantity_on_hand}
+        ).returning(
+            models.StockLevel.product_id,
+            models.StockLevel.warehouse_id,
+            models.StockLevel.location_id,
+            models.StockLevel.quantity_on_hand
+        )
+        events.record_stock(db, (
+            (product_id, warehouse_id, location_id, quantity, deltas[(product_id, warehouse_id, location_id)])
+            for product_id, warehouse_id, location_id, quantity in db.execute(stmt)
+        ))
+    
+    now = datetime.utcnow()
+    db.execute(insert(models.StockMove), [{"created_at": now, **move} for move in moves])
+    watermark.advance(db, [
+        warehouse_id
+        for move in moves
+        for warehouse_id in (move.get("from_warehouse_id"), move.get("to_warehouse_id"))
+    ])
+
+def apply_stock_moves(db: Session, moves: list, lock: bool = False):
+    deltas, debited = _plan_stock_moves(moves)
+    levels = _load_stock_levels(db, deltas.keys(), lock=lock)
+    _check_stock(db, levels, deltas, debited)
+    _flush_stock_moves(db, deltas, moves)
+    
+    return {key: levels.get(key, 0.0) + delta for key, delta in deltas.items()}
+
+def _document_moves(document: models.Document, lines) -> list:
+    move = {
+        "from_warehouse_id": None,
+        "from_location_id": None,
+        "to_warehouse_id": None,
+        "to_location_id": None,
+        "move_type": models.MoveType(document.doc_type.value),
+        "document_id": document.id
+    }
+    if document.doc_type in (models.DocType.DELIVERY, models.DocType.TRANSFER):
+        move["from_warehouse_id"] = document.from_warehouse_id
+        move["from_location_id"] = document.from_location_id
+    if document.doc_type != models.DocType.DELIVERY:
+        move["to_warehouse_id"] = document.to_warehouse_id
+        move["to_location_id"] = document.to_location_id
+    
+    return [{**move, "product_id": product_id, "quantity": quantity} for product_id, quantity in lines]
 
-def validate_delivery(db: Session, document_id: int):
-    document = db.query(models.Document).filter(models.Document.id == document_id).first()
+def _check_document(document: models.Document, lines: list, doc_type: models.DocType = None):
     if not document:
         raise ValueError("Document not found")
     
+    if doc_type is not None and document.doc_type != doc_type:
+        raise ValueError(f"Document is not a {doc_type.value.lower()}")
+    
     if document.status == models.DocStatus.DONE:
         raise ValueError("Document already validated")
     
     if document.status == models.DocStatus.CANCELED:
         raise ValueError("Cannot validate a canceled document")
     
-    if not document.lines or len(document.lines) == 0:
+    if not lines:
         raise ValueError("Document has no line items")
     
-    for line in document.lines:
-        stock_level = db.query(models.StockLevel).filter(
-            models.StockLevel.product_id == line.product_id,
-            models.StockLevel.warehouse_id == document.from_warehouse_id,
-            models.StockLevel.location_id == document.from_location_id
-        ).first()
-        
-        if stock_level:
-            if stock_level.quantity_on_hand < line.quantity:
-                raise ValueError(f"Insufficient stock for product {line.product.name}")
-            stock_level.quantity_on_hand -= line.quantity
-        else:
-            raise ValueError(f"No stock found for product {line.product.name}")
-        
-        stock_move = models.StockMove(
-            product_id=line.product_id,
-            from_warehouse_id=document.from_warehouse_id,
-            from_location_id=document.from_location_id,
-            to_warehouse_id=None,
-            to_location_id=None,
-            quantity=line.quantity,
-            move_type=models.MoveType.DELIVERY,
-            document_id=document.id
-        )
-        db.add(stock_move)
-    
+    if document.doc_type == models.DocType.TRANSFER:
+        if document.from_location_id == document.to_location_id:
+            raise ValueError("Source and destination locations must differ")
+        if any(quantity <= 0 for _, quantity in lines):
+            raise ValueError("Transfer quantities must be positive")
+
+def validate_document(db: Session, document_id: int, doc_type: models.DocType, lock: bool = None):
+    lock = STOCK_LOCKING if lock is None else lock
+    query = db.query(models.Document).filter(models.Document.id == document_id)
+    if lock:
+        query = query.with_for_update()
+    document = query.first()
+    
+    lines = []
+    if document:
+        lines = db.query(models.DocumentLine.product_id, models.DocumentLine.quantity).filter(
+            models.DocumentLine.document_id == document.id
+        ).all()
+    _check_document(document, lines, doc_type)
+    
+    apply_stock_moves(db, _document_moves(document, lines), lock=lock)
+    
+    count_document(db, document.doc_type, document.status, models.DocStatus.DONE)
+    events.record_document(
+        db, document.id, document.doc_type, models.DocStatus.DONE,
+        document.supplier_name or document.customer_name, document.created_at
+    )
     document.status = models.DocStatus.DONE
     document.validated_at = datetime.utcnow()
+    db.flush()
+    refresh_low_stock(db, [product_id for product_id, _ in lines])
     db.commit()
     
     return document
 
-def validate_adjustment(db: Session, document_id: int):
-    document = db.query(models.Document).filter(models.Document.id == document_id).first()
-    if not document:
-        raise ValueError("Document not found")
-    
-    if document.status == models.DocStatus.DONE:
-        raise ValueError("Document already validated")
-    
-    if document.status == models.DocStatus.CANCELED:
-        raise ValueError("Cannot validate a canceled document")
-    
-    if not document.lines or len(document.lines) == 0:
-        raise ValueError("Document has no line items")
-    
-    for line in document.lines:
-        stock_level = db.query(models.StockLevel).filter(
-            models.StockLevel.product_id == line.product_id,
-            models.StockLevel.warehouse_id == document.to_warehouse_id,
-            models.StockLevel.location_id == document.to_location_id
-        ).first()
+def validate_receipt(db: Session, document_id: int, lock: bool = None):
+    return run_with_retries(db, validate_document, document_id, models.DocType.RECEIPT, lock)
+
+def validate_delivery(db: Session, document_id: int, lock: bool = None):
+    return run_with_retries(db, validate_document, document_id, models.DocType.DELIVERY, lock)
+
+def validate_adjustment(db: Session, document_id: int, lock: bool = None):
+    return run_with_retries(db, validate_document, document_id, models.DocType.ADJUSTMENT, lock)
+
+def validate_transfer(db: Session, document_id: int, lock: bool = None):
+    return run_with_retries(db, validate_document, document_id, models.DocType.TRANSFER, lock)
+
+def validate_batch(db: Session, document_ids: list, atomic: bool = True, lock: bool = None):
+    lock = STOCK_LOCKING if lock is None else lock
+    # Documents, stock levels and counters are each locked in key order, so
+    # batches listing the same documents in different orders cannot deadlock.
+    query = db.query(models.Document).filter(
+        models.Document.id.in_(sorted(document_ids))
+    ).order_by(models.Document.id)
+    if lock:
+        query = query.with_for_update()
+    documents = {document.id: document for document in query}
+    
+    lines = {}
+    for document_id, product_id, quantity in db.query(
+        models.DocumentLine.document_id, models.DocumentLine.product_id, models.DocumentLine.quantity
+    ).filter(
+        models.DocumentLine.document_id.in_(documents.keys())
+    ).order_by(models.DocumentLine.id):
+        lines.setdefault(document_id, []).append((product_id, quantity))
+    
+    errors = {}
+    planned = []
+    for document_id in document_ids:
+        document = documents.get(document_id)
+        try:
+            _check_document(document, lines.get(document_id))
+        except ValueError as e:
+            errors[document_id] = str(e)
+            continue
+        moves = _document_moves(document, lines[document_id])
+        planned.append((document, moves) + _plan_stock_moves(moves))
+    
+    # Documents are applied in request order against running balances, so a
+    # delivery may consume stock received earlier in the same batch.
+    keys = set()
+    for _, _, deltas, _ in planned:
+        keys.update(deltas)
+    levels = _load_stock_levels(db, keys, lock=lock)
+    accepted = []
+    for document, moves, deltas, debited in planned:
+        try:
+            _check_stock(db, levels, deltas, debited)
+        except ValueError as e:
+            errors[document.id] = str(e)
+            continue
+        for key, delta in deltas.items():
+            levels[key] = levels.get(key, 0.0) + delta
+        accepted.append((document, moves))
+    
+    if errors and atomic:
+        db.rollback()
+        return [
+            {"id": document_id, "validated": False, "error": errors.get(document_id, "Not validated because another document in the batch failed")}
+            for document_id in document_ids
+        ]
+    
+    if accepted:
+        moves = [move for _, document_moves in accepted for move in document_moves]
+        _flush_stock_moves(db, _plan_stock_moves(moves)[0], moves)
         
-        if stock_level:
-            stock_level.quantity_on_hand += line.quantity
-        else:
-            stock_level = models.StockLevel(
-                product_id=line.product_id,
-                warehouse_id=document.to_warehouse_id,
-                location_id=document.to_location_id,
-                quantity_on_hand=line.quantity
+        counters = {}
+        for document, _ in accepted:
+            events.record_document(
+                db, document.id, document.doc_type, models.DocStatus.DONE,
+                document.supplier_name or document.customer_name, document.created_at
             )
-            db.add(stock_level)
+            for key, delta in (
+                (_document_counter_key(document.doc_type, document.status), -1),
+                (_document_counter_key(document.doc_type, models.DocStatus.DONE), 1)
+            ):
+                counters[key] = counters.get(key, 0) + delta
+        bump_counters(db, counters)
         
-        stock_move = models.StockMove(
-            product_id=line.product_id,
-            from_warehouse_id=None,
-            from_location_id=None,
-            to_warehouse_id=document.to_warehouse_id,
-            to_location_id=document.to_location_id,
-            quantity=line.quantity,
-            move_type=models.MoveType.ADJUSTMENT,
-            document_id=document.id
+        db.query(models.Document).filter(
+            models.Document.id.in_([document.id for document, _ in accepted])
+        ).update(
+            {"status": models.DocStatus.DONE, "validated_at": datetime.utcnow()},
+            synchronize_session=False
         )
-        db.add(stock_move)
-    
-    document.status = models.DocStatus.DONE
-    document.validated_at = datetime.utcnow()
+        refresh_low_stock(db, {move["product_id"] for move in moves})
     db.commit()
     
-    return document
+    return [
+        {"id": document_id, "validated": document_id not in errors, "error": errors.get(document_id)}
+        for document_id in document_ids
+    ]
+
+def batch_document_ids(document_ids: list) -> list:
+    document_ids = list(dict.fromkeys(document_ids))
+    if not document_ids:
+        raise ValueError("No documents to validate")
+    if len(document_ids) > VALIDATION_BATCH_LIMIT:
+        raise ValueError(f"At most {VALIDATION_BATCH_LIMIT} documents can be validated at once")
+    return document_ids
+
+def validate_documents(db: Session, document_ids: list, atomic: bool = True, lock: bool = None):
+    return run_with_retries(db, validate_batch, batch_document_ids(document_ids), atomic, lock)
 
 def update_stock_from_interface(db: Session, product_id: int, adjustment: float, user_id: int, reason: str = None):
+    return run_with_retries(db, adjust_stock, product_id, adjustment)
+
+def adjust_stock(db: Session, product_id: int, adjustment: float, lock: bool = None):
+    lock = STOCK_LOCKING if lock is None else lock
+    if not math.isfinite(adjustment):
+        raise ValueError("Invalid adjustment quantity")
     product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if not product:
         raise ValueError("Product not found")
@@ -250,40 +707,33 @@ def update_stock_from_interface(db: Session, product_id: int, adjustment: float,
         models.StockLevel.product_id == product_id
     ).first()
     
-    if not stock_level:
+    if stock_level:
+        warehouse_id, location_id = stock_level.warehouse_id, stock_level.location_id
+        current_quantity = stock_level.quantity_on_hand
+    else:
         main_wh = db.query(models.Warehouse).first()
         if not main_wh:
             raise ValueError("No warehouse found")
         zone_a = db.query(models.Location).filter(models.Location.warehouse_id == main_wh.id).first()
         if not zone_a:
             raise ValueError("No location found")
-        
-        stock_level = models.StockLevel(
-            product_id=product_id,
-            warehouse_id=main_wh.id,
-            location_id=zone_a.id,
-            quantity_on_hand=0
-        )
-        db.add(stock_level)
-        db.commit()
-        db.refresh(stock_level)
-    
-    new_quantity = stock_level.quantity_on_hand + adjustment
-    if new_quantity < 0:
-        raise ValueError(f"Cannot reduce stock below 0. Current: {stock_level.quantity_on_hand}, Adjustment: {adjustment}")
-    
-    stock_level.quantity_on_hand = new_quantity
-    
-    move = models.StockMove(
-        product_id=product_id,
-        to_warehouse_id=stock_level.warehouse_id if adjustment > 0 else None,
-        to_location_id=stock_level.location_id if adjustment > 0 else None,
-        from_warehouse_id=stock_level.warehouse_id if adjustment < 0 else None,
-        from_location_id=stock_level.location_id if adjustment < 0 else None,
-        quantity=abs(adjustment),
-        move_type=models.MoveType.ADJUSTMENT
-    )
-    db.add(move)
+        warehouse_id, location_id = main_wh.id, zone_a.id
+        current_quantity = 0.0
+    
+    if current_quantity + adjustment < 0:
+        raise ValueError(f"Cannot reduce stock below 0. Current: {current_quantity}, Adjustment: {adjustment}")
+    
+    levels = apply_stock_moves(db, [{
+        "product_id": product_id,
+        "to_warehouse_id": warehouse_id if adjustment > 0 else None,
+        "to_location_id": location_id if adjustment > 0 else None,
+        "from_warehouse_id": warehouse_id if adjustment < 0 else None,
+        "from_location_id": location_id if adjustment < 0 else None,
+        "quantity": abs(adjustment),
+        "move_type": models.MoveType.ADJUSTMENT,
+        "document_id": None
+    }], lock=lock)
+    refresh_low_stock(db, [product_id])
     
     db.commit()
-    return stock_level
+    return levels.get((product_id, warehouse_id, location_id), current_quantity)
@@ -0,0 +1,88 @@
+import asyncio
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import crud
+import models
+import refcache
+import search
+import snapshots
+
+# Reads are issued natively on the AsyncSession. Writes reuse the
+# synchronous stock engine in crud through run_sync, which drives it on
+# the async connection without blocking the event loop.
+
+async def get_dashboard_kpis(db: AsyncSession):
+    result = await db.execute(crud.counters_statement())
+    return crud.kpis_from_counters(crud.fold_counters(result.all()))
+
+async def get_recent_operations(db: AsyncSession, limit: int = 10):
+    result = await db.execute(crud.recent_operations_statement(limit))
+    return result.scalars().all()
+
+async def get_stock_moves(db: AsyncSession, limit: int = 100, cursor: str = None, **filters):
+    result = await db.execute(crud.stock_moves_statement(limit, cursor, **filters))
+    return crud.paginate(result.scalars().all(), limit)
+
+async def list_documents(
+    db: AsyncSession,
+    doc_type: models.DocType,
+    statuses: list = None,
+    cursor: str = None,
+    limit: int = 50
+):
+    result = await db.execute(crud.documents_statement(doc_type, statuses, cursor, limit))
+    return crud.paginate(result.scalars().all(), limit)
+
+async def search_product_ids(db: AsyncSession, query: str, limit: int = search.SEARCH_LIMIT):
+    return await db.run_sync(search.search_product_ids, query, limit)
+
+async def get_stock_summary(db: AsyncSession, search: str = None):
+    product_ids = await search_product_ids(db, search) if search else None
+    result = await db.execute(crud.stock_summary_statement(product_ids))
+    return crud.stock_items(result.all(), product_ids)
+
+async def stock_as_of(db: AsyncSession, at, product_id: int = None, warehouse_id: int = None, location_id: int = None):
+    return await db.run_sync(snapshots.stock_as_of, at, product_id, warehouse_id, location_id)
+
+async def create_document(db: AsyncSession, doc_type: models.DocType, header: dict, lines: list, created_by: int) -> int:
+    reference = await refcache.get_reference_data(db)
+    values, lines = crud.prepare_document(reference, doc_type, header, lines)
+    return await db.run_sync(crud.create_document, values, lines, created_by)
+
+async def bump_counters(db: AsyncSession, deltas: dict):
+    await db.run_sync(crud.bump_counters, deltas)
+
+async def count_document(db: AsyncSession, doc_type: models.DocType, old_status, new_status):
+    await db.run_sync(crud.count_document, doc_type, old_status, new_status)
+
+async def run_with_retries(db: AsyncSession, operation, *args, **kwargs):
+    # Same policy as crud.run_with_retries, but the backoff awaits so a
+    # conflict burst does not stall every request on the worker.
+    for attempt in range(crud.VALIDATION_RETRIES + 1):
+        try:
+            return await db.run_sync(crud.run_attempt, operation, *args, **kwargs)
+        except DBAPIError as e:
+            delay = crud.retry_delay(e, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+
+async def validate_receipt(db: AsyncSession, document_id: int, lock: bool = None):
+    return await run_with_retries(db, crud.validate_document, document_id, models.DocType.RECEIPT, lock)
+
+async def validate_delivery(db: AsyncSession, document_id: int, lock: bool = None):
+    return await run_with_retries(db, crud.validate_document, document_id, models.DocType.DELIVERY, lock)
+
+async def validate_adjustment(db: AsyncSession, document_id: int, lock: bool = None):
+    return await run_with_retries(db, crud.validate_document, document_id, models.DocType.ADJUSTMENT, lock)
+
+async def validate_transfer(db: AsyncSession, document_id: int, lock: bool = None):
+    return await run_with_retries(db, crud.validate_document, document_id, models.DocType.TRANSFER, lock)
+
+async def validate_documents(db: AsyncSession, document_ids: list, atomic: bool = True, lock: bool = None):
+    return await run_with_retries(db, crud.validate_batch, crud.batch_document_ids(document_ids), atomic, lock)
+
+async def update_stock_from_interface(db: AsyncSession, product_id: int, adjustment: float, user_id: int, reason: str = None):
+    return await run_with_retries(db, crud.adjust_stock, product_id, adjustment)
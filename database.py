@@ -1,9 +1,14 @@
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, inspect, select, text, tuple_
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+from metrics import TimedAsyncQueuePool, TimedQueuePool, instrument_engine
+import querydebug
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -23,13 +28,98 @@ if "dpg-" in DATABASE_URL or "render" in DATABASE_URL.lower():
         DATABASE_URL = DATABASE_URL + ("&" if "?" in DATABASE_URL else "?") + "sslmode=require"
     engine_args["connect_args"] = {"sslmode": "require"}
 
+# Pool checkouts are timed on PostgreSQL, where waiting for a connection
+# is what shows up under load.
+if make_url(DATABASE_URL).get_backend_name() == "postgresql":
+    engine_args["poolclass"] = TimedQueuePool
+
 engine = create_engine(DATABASE_URL, **engine_args)
+instrument_engine(engine)
+querydebug.instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def _async_url(url: str):
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    # asyncpg takes ssl as a connect argument instead of libpq's sslmode
+    return url.set(drivername=ASYNC_DRIVERS[backend]).difference_update_query(["sslmode"])
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+async_engine_args = {
+    "pool_pre_ping": True,
+    "pool_recycle": 300,
+}
+if "connect_args" in engine_args:
+    async_engine_args["connect_args"] = {"ssl": "require"}
+if "poolclass" in engine_args:
+    async_engine_args["poolclass"] = TimedAsyncQueuePool
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **async_engine_args)
+instrument_engine(async_engine.sync_engine)
+querydebug.instrument_engine(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+def merge_duplicate_stock_levels(connection) -> int:
+    # Databases created before uq_stock_level_key may hold several rows for
+    # one product/warehouse/location. Fold each group into its lowest id with
+    # the summed quantity so the unique index can be built.
+    table = Base.metadata.tables["stock_levels"]
+    key = (table.c.product_id, table.c.warehouse_id, table.c.location_id)
+    duplicates = connection.execute(
+        select(*key, func.min(table.c.id), func.sum(table.c.quantity_on_hand)).group_by(*key).having(func.count() > 1)
+    ).all()
+    for product_id, warehouse_id, location_id, keep_id, quantity in duplicates:
+        connection.execute(table.update().where(table.c.id == keep_id).values(quantity_on_hand=quantity))
+        connection.execute(table.delete().where(
+            tuple_(*key) == (product_id, warehouse_id, location_id),
+            table.c.id != keep_id
+        ))
+    return len(duplicates)
+
+def create_schema(bind=engine):
+    if isinstance(bind, Engine):
+        with bind.begin() as connection:
+            return create_schema(connection)
+    Base.metadata.create_all(bind=bind)
+    if "uq_stock_level_key" not in {index["name"] for index in inspect(bind).get_indexes("stock_levels")}:
+        merge_duplicate_stock_levels(bind)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+
+def advisory_lock(connection, name: str):
+    # Serialises one-off maintenance steps across instances until the
+    # surrounding transaction ends. SQLite already allows a single writer.
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("SELECT pg_advisory_xact_lock(hashtext(:name))"), {"name": name})
+
+def insert_for(db):
+    # Accepts a Session or a Connection (inside mapper events).
+    dialect = (db.dialect if isinstance(db, Connection) else db.get_bind().dialect).name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"Upserts are not supported on {dialect}")
+    return insert
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,148 @@
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+import auth
+import models
+
+WAREHOUSES = [
+    {"name": "Main Warehouse", "code": "WH/Stock", "address": "123 Main Street, Mumbai"},
+    {"name": "North Warehouse", "code": "WH/North", "address": "456 North Avenue, Delhi"},
+    {"name": "South Warehouse", "code": "WH/South", "address": "789 South Road, Bangalore"}
+]
+
+ZONES = [
+    {"name": "Zone A", "code": "A"},
+    {"name": "Zone B", "code": "B"},
+    {"name": "Zone C", "code": "C"}
+]
+
+CATEGORIES = ["Electronics", "Furniture", "Office Supplies", "Hardware"]
+
+PRODUCTS = [
+    {"name": "Desk", "sku": "DESK001", "category": "Furniture", "uom": "Units", "cost": 3000.0, "reorder_level": 10},
+    {"name": "Office Table", "sku": "TABLE001", "category": "Furniture", "uom": "Units", "cost": 3000.0, "reorder_level": 5},
+    {"name": "Office Chair", "sku": "CHAIR001", "category": "Furniture", "uom": "Units", "cost": 1500.0, "reorder_level": 15},
+    {"name": "Laptop", "sku": "LAP001", "category": "Electronics", "uom": "Units", "cost": 45000.0, "reorder_level": 5},
+    {"name": "Monitor", "sku": "MON001", "category": "Electronics", "uom": "Units", "cost": 12000.0, "reorder_level": 8},
+    {"name": "Keyboard", "sku": "KEY001", "category": "Electronics", "uom": "Units", "cost": 800.0, "reorder_level": 20},
+    {"name": "Mouse", "sku": "MOU001", "category": "Electronics", "uom": "Units", "cost": 400.0, "reorder_level": 25},
+    {"name": "Pen", "sku": "PEN001", "category": "Office Supplies", "uom": "Box", "cost": 50.0, "reorder_level": 100},
+    {"name": "Paper A4", "sku": "PAP001", "category": "Office Supplies", "uom": "Ream", "cost": 200.0, "reorder_level": 50},
+    {"name": "Stapler", "sku": "STA001", "category": "Office Supplies", "uom": "Units", "cost": 150.0, "reorder_level": 30}
+]
+
+# (product index, quantity) per demo document
+RECEIVED_LINES = [(0, 50), (1, 50), (2, 100), (3, 30), (4, 40)]
+PENDING_RECEIPT_LINES = [(5, 50), (6, 60)]
+PENDING_DELIVERY_LINES = [(0, 5), (2, 10)]
+
+ADMIN_EMAIL = "admin@example.com"
+ADMIN_PASSWORD = "admin123"
+
+def _insert_returning_ids(db: Session, model, rows: list) -> list:
+    return list(db.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), rows))
+
+def ensure_admin(db: Session) -> int:
+    admin_id = db.query(models.User.id).filter(models.User.email == ADMIN_EMAIL).scalar()
+    if admin_id is None:
+        admin_id = db.scalar(insert(models.User).values(
+            name="Admin User",
+            email=ADMIN_EMAIL,
+            password_hash=auth.get_password_hash(ADMIN_PASSWORD),
+            role=models.UserRole.ADMIN
+        ).returning(models.User.id))
+    return admin_id
+
+def is_seeded(db: Session) -> bool:
+    return db.query(models.Warehouse.id).first() is not None or db.query(models.Product.id).first() is not None
+
+def seed_demo_data(db: Session):
+    now = datetime.utcnow()
+    admin_id = ensure_admin(db)
+
+    warehouse_ids = _insert_returning_ids(db, models.Warehouse, WAREHOUSES)
+    location_ids = _insert_returning_ids(db, models.Location, [
+        {"warehouse_id": warehouse_id, **zone} for warehouse_id in warehouse_ids for zone in ZONES
+    ])
+    category_ids = dict(zip(CATEGORIES, _insert_returning_ids(db, models.Category, [
+        {"name": name} for name in CATEGORIES
+    ])))
+    product_ids = _insert_returning_ids(db, models.Product, [
+        {
+            "name": product["name"],
+            "sku": product["sku"],
+            "category_id": category_ids[product["category"]],
+            "uom": product["uom"],
+            "cost": product["cost"],
+            "reorder_level": product["reorder_level"],
+            "is_active": True,
+            "created_at": now,
+            "updated_at": now
+        }
+        for product in PRODUCTS
+    ])
+
+    main_warehouse_id, zone_a_id = warehouse_ids[0], location_ids[0]
+    received_id, pending_receipt_id, pending_delivery_id = _insert_returning_ids(db, models.Document, [
+        {
+            "doc_type": models.DocType.RECEIPT,
+            "status": models.DocStatus.DONE,
+            "supplier_name": "Aman Sharma",
+            "to_warehouse_id": main_warehouse_id,
+            "to_location_id": zone_a_id,
+            "created_by": admin_id,
+            "created_at": now,
+            "validated_at": now
+        },
+        {
+            "doc_type": models.DocType.RECEIPT,
+            "status": models.DocStatus.READY,
+            "supplier_name": "Vendor ABC",
+            "to_warehouse_id": main_warehouse_id,
+            "to_location_id": zone_a_id,
+            "created_by": admin_id,
+            "created_at": now
+        },
+        {
+            "doc_type": models.DocType.DELIVERY,
+            "status": models.DocStatus.READY,
+            "customer_name": "Aman Sharma",
+            "from_warehouse_id": main_warehouse_id,
+            "from_location_id": zone_a_id,
+            "created_by": admin_id,
+            "created_at": now
+        }
+    ])
+
+    db.execute(insert(models.DocumentLine), [
+        {"document_id": document_id, "product_id": product_ids[index], "quantity": quantity}
+        for document_id, lines in (
+            (received_id, RECEIVED_LINES),
+            (pending_receipt_id, PENDING_RECEIPT_LINES),
+            (pending_delivery_id, PENDING_DELIVERY_LINES)
+        )
+        for index, quantity in lines
+    ])
+    db.execute(insert(models.StockLevel), [
+        {
+            "product_id": product_ids[index],
+            "warehouse_id": main_warehouse_id,
+            "location_id": zone_a_id,
+            "quantity_on_hand": quantity
+        }
+        for index, quantity in RECEIVED_LINES
+    ])
+    db.execute(insert(models.StockMove), [
+        {
+            "product_id": product_ids[index],
+            "to_warehouse_id": main_warehouse_id,
+            "to_location_id": zone_a_id,
+            "quantity": quantity,
+            "move_type": models.MoveType.RECEIPT,
+            "document_id": received_id,
+            "created_at": now
+        }
+        for index, quantity in RECEIVED_LINES
+    ])
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import os
+from typing import Optional
+
+import orjson
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "stockmaster_events")
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+
+# NOTIFY payloads must stay below 8000 bytes.
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+logger = logging.getLogger("stockmaster.events")
+
+class Broker:
+    # Fans each committed change out to the SSE streams of this worker. A
+    # payload is serialized once and shared by every subscriber queue; a
+    # subscriber that falls EVENTS_QUEUE_SIZE messages behind gets a resync
+    # marker (None) instead of the backlog.
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._loop = None
+        self.published = 0
+        self.resyncs = 0
+
+    def subscribe(self) -> asyncio.Queue:
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, payload: Optional[bytes]):
+        # Safe to call from any thread; delivery happens on the event loop.
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self._subscribers:
+            return
+        loop.call_soon_threadsafe(self._dispatch, payload)
+
+    def _dispatch(self, payload: Optional[bytes]):
+        self.published += 1
+        for queue in list(self._subscribers):
+            if payload is not None:
+                try:
+                    queue.put_nowait(payload)
+                    continue
+                except asyncio.QueueFull:
+                    pass
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(None)
+            self.resyncs += 1
+
+    def stats(self):
+        return {"subscribers": len(self._subscribers), "published": self.published, "resyncs": self.resyncs}
+
+broker = Broker(EVENTS_QUEUE_SIZE)
+
+def _pending(db: Session) -> dict:
+    return db.info.setdefault("events", {"stock": [], "documents": [], "counters": {}})
+
+def record_stock(db: Session, levels):
+    _pending(db)["stock"].extend(
+        {
+            "product_id": product_id,
+            "warehouse_id": warehouse_id,
+            "location_id": location_id,
+            "quantity": quantity,
+            "delta": delta
+        }
+        for product_id, warehouse_id, location_id, quantity, delta in levels
+    )
+
+def record_document(db: Session, document_id: int, doc_type, status, partner: Optional[str], created_at):
+    _pending(db)["documents"].append({
+        "id": document_id,
+        "doc_type": doc_type.value,
+        "status": status.value,
+        "partner": partner,
+        "created_at": created_at
+    })
+
+def record_counters(db: Session, deltas: dict):
+    counters = _pending(db)["counters"]
+    for key, delta in deltas.items():
+        counters[key] = counters.get(key, 0) + delta
+
+def _payloads(message: dict) -> list:
+    payload = orjson.dumps(message)
+    lists = [key for key, value in message.items() if isinstance(value, list)]
+    if len(payload) <= NOTIFY_PAYLOAD_LIMIT or sum(len(message[key]) for key in lists) <= 1:
+        return [payload]
+    first, second = dict(message), {key: [] for key in lists}
+    for key in lists:
+        middle = len(message[key]) // 2
+        first[key], second[key] = message[key][:middle], message[key][middle:]
+    return _payloads(first) + _payloads(second)
+
+def _message(pending: dict) -> dict:
+    message = {key: value for key, value in pending.items() if value}
+    if "counters" in message:
+        message["counters"] = {key: value for key, value in message["counters"].items() if value}
+    return message
+
+@event.listens_for(Session, "before_commit")
+def _notify_before_commit(session):
+    # On PostgreSQL the change rides along with the transaction as a NOTIFY,
+    # which is only delivered if it commits and reaches every worker's
+    # listener, this one included.
+    pending = session.info.get("events")
+    if pending is None or session.get_bind().dialect.name != "postgresql":
+        return
+    session.info.pop("events")
+    message = _message(pending)
+    for payload in _payloads(message) if message else ():
+        session.execute(select(func.pg_notify(EVENTS_CHANNEL, payload.decode())))
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session):
+    pending = session.info.pop("events", None)
+    message = _message(pending) if pending is not None else None
+    if message:
+        broker.publish(orjson.dumps(message))
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("events", None)
+
+async def listen(database_url, connect_args: dict):
+    # Bridges NOTIFYs from all workers into the local broker over a
+    # dedicated asyncpg connection outside the SQLAlchemy pool. Anything
+    # sent while it reconnects is lost, so subscribers are told to resync.
+    import asyncpg
+
+    dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+    delay = 1.0
+    connected_before = False
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn, **connect_args)
+            await connection.add_listener(
+                EVENTS_CHANNEL, lambda connection, pid, channel, payload: broker.publish(payload.encode())
+            )
+            if connected_before:
+                broker.publish(None)
+            connected_before = True
+            delay = 1.0
+            while True:
+                await asyncio.sleep(EVENTS_HEARTBEAT)
+                await connection.execute("SELECT 1")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Event listener connection lost (%s), reconnecting in %.0fs", e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+
+async def stream(queue: asyncio.Queue):
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                payload = await asyncio.wait_for(queue.get(), EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if payload is None:
+                yield "event: resync\ndata: {}\n\n"
+            else:
+                yield f"data: {payload.decode()}\n\n"
+    finally:
+        broker.unsubscribe(queue)
@@ -0,0 +1,136 @@
+import csv
+import enum
+import io
+import json
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+
+from database import SessionLocal
+import models
+
+BATCH_SIZE = 5000
+
+MOVE_COLUMNS = [
+    "id", "created_at", "move_type", "document_id", "product_id", "sku", "quantity",
+    "from_warehouse", "from_location", "to_warehouse", "to_location"
+]
+
+STOCK_COLUMNS = [
+    "product_id", "sku", "warehouse_id", "warehouse", "location_id", "location", "quantity_on_hand"
+]
+
+def moves_statement(date_from: datetime = None, date_to: datetime = None):
+    from_warehouse = aliased(models.Warehouse)
+    to_warehouse = aliased(models.Warehouse)
+    from_location = aliased(models.Location)
+    to_location = aliased(models.Location)
+
+    statement = select(
+        models.StockMove.id,
+        models.StockMove.created_at,
+        models.StockMove.move_type,
+        models.StockMove.document_id,
+        models.StockMove.product_id,
+        models.Product.sku,
+        models.StockMove.quantity,
+        from_warehouse.code,
+        from_location.code,
+        to_warehouse.code,
+        to_location.code
+    ).join(
+        models.Product, models.Product.id == models.StockMove.product_id
+    ).outerjoin(
+        from_warehouse, from_warehouse.id == models.StockMove.from_warehouse_id
+    ).outerjoin(
+        from_location, from_location.id == models.StockMove.from_location_id
+    ).outerjoin(
+        to_warehouse, to_warehouse.id == models.StockMove.to_warehouse_id
+    ).outerjoin(
+        to_location, to_location.id == models.StockMove.to_location_id
+    )
+
+    if date_from:
+        statement = statement.where(models.StockMove.created_at >= date_from)
+    if date_to:
+        statement = statement.where(models.StockMove.created_at < date_to)
+
+    return statement.order_by(models.StockMove.created_at, models.StockMove.id)
+
+def stock_statement():
+    return select(
+        models.StockLevel.product_id,
+        models.Product.sku,
+        models.StockLevel.warehouse_id,
+        models.Warehouse.code,
+        models.StockLevel.location_id,
+        models.Location.code,
+        models.StockLevel.quantity_on_hand
+    ).join(
+        models.Product, models.Product.id == models.StockLevel.product_id
+    ).join(
+        models.Warehouse, models.Warehouse.id == models.StockLevel.warehouse_id
+    ).join(
+        models.Location, models.Location.id == models.StockLevel.location_id
+    ).order_by(
+        models.StockLevel.product_id,
+        models.StockLevel.warehouse_id,
+        models.StockLevel.location_id
+    )
+
+def iter_rows(statement, batch_size: int = BATCH_SIZE):
+    # Runs in its own session: the request session is closed before a
+    # streaming response body is consumed.
+    db = SessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=batch_size))
+        for partition in result.partitions():
+            yield partition
+    finally:
+        db.close()
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def iter_csv(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows([_plain(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def iter_ndjson(columns, batches):
+    for batch in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, map(_plain, row))), separators=(",", ":")) + "\n"
+            for row in batch
+        ).encode()
+
+def iter_gzip(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def stream_export(columns, statement, fmt: str = "csv", compress: bool = False):
+    if fmt == "ndjson":
+        chunks = iter_ndjson(columns, iter_rows(statement))
+    elif fmt == "csv":
+        chunks = iter_csv(columns, iter_rows(statement))
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+
+    return iter_gzip(chunks) if compress else chunks
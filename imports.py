@@ -0,0 +1,294 @@
+import csv
+import io
+import json
+import math
+import time
+from datetime import datetime
+from itertools import islice
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+
+import crud
+import models
+import refcache
+import search
+
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+
+PRODUCT_COLUMNS = ["name", "sku", "category_id", "uom", "cost", "reorder_level"]
+LINE_COLUMNS = ["document_id", "product_id", "quantity"]
+
+class ImportReport:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = 0
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, row: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "failed": self.error_count,
+            "errors": self.errors,
+            "errors_truncated": self.error_count > len(self.errors),
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed) if elapsed else None
+        }
+
+def detect_format(filename: str, fmt: str = None) -> str:
+    if fmt:
+        return fmt
+    if filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    return "csv"
+
+def read_records(stream, fmt: str):
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        for row_number, record in enumerate(csv.DictReader(text_stream), start=1):
+            yield row_number, record
+    elif fmt == "ndjson":
+        row_number = 0
+        for line in text_stream:
+            if not line.strip():
+                continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield row_number, ValueError(f"Invalid JSON: {e}")
+                continue
+            if not isinstance(record, dict):
+                record = ValueError("Expected a JSON object")
+            yield row_number, record
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+def _chunks(records, size: int = CHUNK_SIZE):
+    records = iter(records)
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _text(record: dict, field: str):
+    value = record.get(field)
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def _number(record: dict, field: str, default: float = None) -> float:
+    value = record.get(field)
+    if value is None or str(value).strip() == "":
+        if default is None:
+            raise ValueError(f"{field} is required")
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number")
+    if not math.isfinite(number):
+        raise ValueError(f"{field} must be a finite number")
+    return number
+
+def _use_copy(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def _copy_rows(db: Session, table: str, columns, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+def _validate_product(record: dict, categories: dict) -> dict:
+    name = _text(record, "name")
+    sku = _text(record, "sku")
+    uom = _text(record, "uom")
+    if not name:
+        raise ValueError("name is required")
+    if not sku:
+        raise ValueError("sku is required")
+    if not uom:
+        raise ValueError("uom is required")
+
+    category_id = None
+    category = _text(record, "category")
+    if category:
+        if category not in categories:
+            raise ValueError(f"Unknown category {category}")
+        category_id = categories[category]
+
+    cost = _number(record, "cost", 0.0)
+    reorder_level = _number(record, "reorder_level", 0.0)
+    if cost < 0 or reorder_level < 0:
+        raise ValueError("cost and reorder_level must not be negative")
+
+    return {
+        "name": name,
+        "sku": sku,
+        "category_id": category_id,
+        "uom": uom,
+        "cost": cost,
+        "reorder_level": reorder_level
+    }
+
+def _load_products(db: Session, rows: list) -> set:
+    now = datetime.utcnow()
+    if not _use_copy(db):
+        db.execute(insert(models.Product), [
+            {**row, "is_active": True, "created_at": now, "updated_at": now} for row in rows
+        ])
+        return {row["sku"] for row in rows}
+
+    db.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS product_import "
+        "(name text, sku text, category_id integer, uom text, cost double precision, reorder_level double precision) "
+        "ON COMMIT DELETE ROWS"
+    ))
+    _copy_rows(db, "product_import", PRODUCT_COLUMNS, [[row[c] for c in PRODUCT_COLUMNS] for row in rows])
+    inserted = db.execute(text(
+        "INSERT INTO products (name, sku, category_id, uom, cost, reorder_level, is_active, created_at, updated_at) "
+        "SELECT name, sku, category_id, uom, cost, reorder_level, true, :now, :now FROM product_import "
+        "ON CONFLICT (sku) DO NOTHING RETURNING sku"
+    ), {"now": now}).scalars().all()
+    return set(inserted)
+
+def import_products(db: Session, stream, fmt: str = "csv") -> dict:
+    report = ImportReport()
+    categories = dict(db.query(models.Category.name, models.Category.id).all())
+    seen = set()
+
+    for chunk in _chunks(read_records(stream, fmt)):
+        report.rows += len(chunk)
+        valid = []
+        for row_number, record in chunk:
+            if isinstance(record, Exception):
+                report.error(row_number, str(record))
+                continue
+            try:
+                row = _validate_product(record, categories)
+            except ValueError as e:
+                report.error(row_number, str(e))
+                continue
+            if row["sku"] in seen:
+                report.error(row_number, f"Duplicate SKU {row['sku']} in file")
+                continue
+            seen.add(row["sku"])
+            valid.append((row_number, row))
+
+        existing = set()
+        if valid:
+            existing = {
+                sku for (sku,) in db.query(models.Product.sku).filter(
+                    models.Product.sku.in_([row["sku"] for _, row in valid])
+                )
+            }
+
+        rows = []
+        for row_number, row in valid:
+            if row["sku"] in existing:
+                report.error(row_number, f"SKU {row['sku']} already exists")
+            else:
+                rows.append((row_number, row))
+
+        if rows:
+            inserted = _load_products(db, [row for _, row in rows])
+            for row_number, row in rows:
+                if row["sku"] not in inserted:
+                    report.error(row_number, f"SKU {row['sku']} already exists")
+            crud.bump_counters(db, {"products.active": len(inserted)})
+            refcache.bump_version(db)
+            report.inserted += len(inserted)
+        db.commit()
+
+    search.invalidate()
+    return report.as_dict()
+
+CLOSED_STATUSES = (models.DocStatus.DONE, models.DocStatus.CANCELED)
+
+def import_document_lines(db: Session, document_id: int, stream, fmt: str = "csv") -> dict:
+    document = db.query(models.Document).filter(models.Document.id == document_id).first()
+    if not document:
+        raise ValueError("Document not found")
+    if document.status in CLOSED_STATUSES:
+        raise ValueError("Cannot add lines to a closed document")
+
+    report = ImportReport()
+    for chunk in _chunks(read_records(stream, fmt)):
+        report.rows += len(chunk)
+        parsed = []
+        for row_number, record in chunk:
+            if isinstance(record, Exception):
+                report.error(row_number, str(record))
+                continue
+            try:
+                quantity = _number(record, "quantity")
+                if quantity == 0:
+                    raise ValueError("quantity must not be zero")
+                if quantity < 0 and document.doc_type != models.DocType.ADJUSTMENT:
+                    raise ValueError("quantity must be positive")
+                sku = _text(record, "sku")
+                product_id = _text(record, "product_id")
+                if not sku and not product_id:
+                    raise ValueError("sku or product_id is required")
+                parsed.append((row_number, sku, int(product_id) if product_id else None, quantity))
+            except ValueError as e:
+                report.error(row_number, str(e))
+
+        skus = {sku for _, sku, _, _ in parsed if sku}
+        ids = {product_id for _, _, product_id, _ in parsed if product_id}
+        by_sku, known_ids = {}, set()
+        if skus:
+            by_sku = dict(db.query(models.Product.sku, models.Product.id).filter(models.Product.sku.in_(skus)))
+        if ids:
+            known_ids = {pid for (pid,) in db.query(models.Product.id).filter(models.Product.id.in_(ids))}
+
+        rows, row_numbers = [], []
+        for row_number, sku, product_id, quantity in parsed:
+            if sku:
+                product_id = by_sku.get(sku)
+                if product_id is None:
+                    report.error(row_number, f"Unknown SKU {sku}")
+                    continue
+            elif product_id not in known_ids:
+                report.error(row_number, f"Unknown product {product_id}")
+                continue
+            rows.append([document_id, product_id, quantity])
+            row_numbers.append(row_number)
+
+        if rows:
+            # Each chunk commits on its own, so re-check the status under the
+            # row lock validation takes: lines must not land on a document
+            # that was validated or canceled since the previous chunk.
+            status = db.query(models.Document.status).filter(
+                models.Document.id == document_id
+            ).with_for_update().scalar()
+            if status in CLOSED_STATUSES:
+                db.rollback()
+                for row_number in row_numbers:
+                    report.error(row_number, "Document was closed during the import")
+                break
+            if _use_copy(db):
+                _copy_rows(db, "document_lines", LINE_COLUMNS, rows)
+            else:
+                db.execute(insert(models.DocumentLine), [dict(zip(LINE_COLUMNS, row)) for row in rows])
+            report.inserted += len(rows)
+        db.commit()
+
+    return report.as_dict()
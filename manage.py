@@ -0,0 +1,144 @@
+import argparse
+import sys
+
+from database import SessionLocal, advisory_lock, create_schema, engine
+import crud
+import demo_data
+import models
+import search
+import snapshots
+
+def init_db(args):
+    with engine.begin() as connection:
+        advisory_lock(connection, "stockmaster.init-db")
+        create_schema(connection)
+        if search.create_search_indexes(connection):
+            print("Trigram search indexes are in place")
+    print("Schema is up to date")
+    if args.seed:
+        return seed(args)
+    return 0
+
+def seed(args):
+    db = SessionLocal()
+    try:
+        advisory_lock(db.connection(), "stockmaster.seed")
+        if demo_data.is_seeded(db):
+            demo_data.ensure_admin(db)
+            db.commit()
+            print("Database already has data, demo seed skipped")
+            return 0
+        demo_data.seed_demo_data(db)
+        crud.rebuild_kpi_counters(db)
+        print("Demo data loaded")
+        return 0
+    finally:
+        db.close()
+
+def rebuild_counters(args):
+    db = SessionLocal()
+    try:
+        if args.check:
+            stored = crud.fold_counters(db.execute(crud.counters_statement()))
+            expected, _ = crud.compute_kpi_counters(db)
+            drift = {
+                key: (stored.get(key, 0), value)
+                for key, value in expected.items()
+                if stored.get(key, 0) != value
+            }
+            for key, (current, value) in sorted(drift.items()):
+                print(f"{key}: stored={current} actual={value}")
+            if drift:
+                return 1
+            print("KPI counters are up to date")
+            return 0
+
+        counters = crud.rebuild_kpi_counters(db)
+        for key, value in sorted(counters.items()):
+            print(f"{key}: {value}")
+        return 0
+    finally:
+        db.close()
+
+def take_snapshot(args):
+    db = SessionLocal()
+    try:
+        at = snapshots.parse_timestamp(args.at) if args.at else None
+        snapshot = snapshots.take_snapshot(db, at, args.min_moves)
+        if snapshot is None:
+            print(f"Fewer than {args.min_moves} moves since the last snapshot, skipped")
+        else:
+            lines = db.query(models.StockSnapshotLine).filter(
+                models.StockSnapshotLine.snapshot_id == snapshot.id
+            ).count()
+            print(f"Snapshot {snapshot.id} at {snapshot.taken_at.isoformat()}: {lines} lines, {snapshot.move_count} moves since previous")
+        if args.keep:
+            pruned = snapshots.prune_snapshots(db, args.keep)
+            if pruned:
+                print(f"Pruned {pruned} old snapshots")
+        return 0
+    except ValueError as e:
+        print(e)
+        return 1
+    finally:
+        db.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="StockMaster management commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    init_parser = subparsers.add_parser(
+        "init-db",
+        help="Create missing tables and indexes, including the trigram search indexes on PostgreSQL"
+    )
+    init_parser.add_argument(
+        "--seed",
+        action="store_true",
+        help="Also load the demo data into an empty database"
+    )
+    init_parser.set_defaults(func=init_db)
+    
+    seed_parser = subparsers.add_parser(
+        "seed",
+        help="Load the demo warehouses, products and documents into an empty database"
+    )
+    seed_parser.set_defaults(func=seed)
+    
+    counters_parser = subparsers.add_parser(
+        "rebuild-counters",
+        help="Recompute the dashboard KPI counters from the documents and stock tables"
+    )
+    counters_parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only report counters that drifted from the recomputed values"
+    )
+    counters_parser.set_defaults(func=rebuild_counters)
+    
+    snapshot_parser = subparsers.add_parser(
+        "snapshot",
+        help="Record stock levels as of a cutoff so point-in-time queries replay fewer moves"
+    )
+    snapshot_parser.add_argument(
+        "--at",
+        help="Cutoff as an ISO datetime (default: now minus STOCK_SNAPSHOT_LAG)"
+    )
+    snapshot_parser.add_argument(
+        "--min-moves",
+        type=int,
+        default=0,
+        help="Skip the snapshot unless at least this many moves happened since the previous one"
+    )
+    snapshot_parser.add_argument(
+        "--keep",
+        type=int,
+        default=0,
+        help="Delete all but the newest N snapshots afterwards"
+    )
+    snapshot_parser.set_defaults(func=take_snapshot)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
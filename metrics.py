@@ -0,0 +1,243 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_values=()):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for label_values, counts, total, count in sorted(series):
+            labels = _labels(self.labels, label_values)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, ("le", _number(bound)))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, ("le", "+Inf"))} {count}')
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, label_values=(), amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def _gauges(name: str, help: str, samples):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    return lines
+
+REQUESTS = Counter(
+    "stockmaster_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+REQUEST_DURATION = Histogram(
+    "stockmaster_http_request_duration_seconds", "HTTP request latency", LATENCY_BUCKETS, ("method", "route")
+)
+REQUEST_DB_DURATION = Histogram(
+    "stockmaster_http_request_db_seconds", "Time spent executing SQL per request", LATENCY_BUCKETS, ("method", "route")
+)
+REQUEST_QUERIES = Histogram(
+    "stockmaster_http_request_queries", "SQL statements executed per request", QUERY_COUNT_BUCKETS, ("method", "route")
+)
+REQUEST_POOL_WAIT = Histogram(
+    "stockmaster_http_request_pool_wait_seconds", "Time spent waiting for pooled connections per request",
+    POOL_WAIT_BUCKETS, ("method", "route")
+)
+QUERY_DURATION = Histogram(
+    "stockmaster_db_query_duration_seconds", "SQL statement latency", LATENCY_BUCKETS
+)
+POOL_WAIT = Histogram(
+    "stockmaster_db_pool_wait_seconds", "Time spent waiting to check out a pooled connection", POOL_WAIT_BUCKETS, ("pool",)
+)
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "pool_wait")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+
+# SQLAlchemy copies the caller's context into the greenlets it uses for
+# AsyncSession, and run_in_threadpool copies it into worker threads, so the
+# same RequestStats object is reachable from every query of a request.
+_request_stats = ContextVar("request_stats", default=None)
+
+class _TimedPoolMixin:
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            POOL_WAIT.observe(waited, (self.pool_label,))
+            stats = _request_stats.get()
+            if stats is not None:
+                stats.pool_wait += waited
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pool_label = "sync"
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pool_label = "async"
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    elapsed = time.perf_counter() - started
+    QUERY_DURATION.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+def _handle_error(exception_context):
+    stack = exception_context.connection.info.get("query_started") if exception_context.connection is not None else None
+    if stack:
+        stack.pop()
+
+def instrument_engine(engine):
+    if not METRICS_ENABLED:
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    def _route_label(self, scope) -> str:
+        if self._route_paths is None:
+            self._route_paths = {
+                route.endpoint: route.path
+                for route in scope["app"].routes
+                if getattr(route, "endpoint", None) is not None
+            }
+        endpoint = scope.get("endpoint")
+        if endpoint in self._route_paths:
+            return self._route_paths[endpoint]
+        for route in scope["app"].routes:
+            if getattr(route, "endpoint", None) is None and scope["path"].startswith(route.path + "/"):
+                return route.path
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            labels = (scope["method"], self._route_label(scope))
+            REQUESTS.inc(labels + (str(status_code[0]),))
+            REQUEST_DURATION.observe(elapsed, labels)
+            REQUEST_DB_DURATION.observe(stats.db_time, labels)
+            REQUEST_QUERIES.observe(stats.queries, labels)
+            REQUEST_POOL_WAIT.observe(stats.pool_wait, labels)
+
+def _pool_samples(engines):
+    samples = {"size": [], "checked_out": [], "overflow": []}
+    for label, engine in engines.items():
+        pool = engine.pool
+        if not isinstance(pool, QueuePool):
+            continue
+        samples["size"].append(({"pool": label}, pool.size()))
+        samples["checked_out"].append(({"pool": label}, pool.checkedout()))
+        samples["overflow"].append(({"pool": label}, max(pool.overflow(), 0)))
+    return samples
+
+def render(engines: dict, extra_gauges=()) -> str:
+    lines = []
+    for metric in (
+        REQUESTS, REQUEST_DURATION, REQUEST_DB_DURATION, REQUEST_QUERIES, REQUEST_POOL_WAIT, QUERY_DURATION, POOL_WAIT
+    ):
+        lines.extend(metric.render())
+
+    pools = _pool_samples(engines)
+    lines.extend(_gauges("stockmaster_db_pool_size", "Configured pool size", pools["size"]))
+    lines.extend(_gauges("stockmaster_db_pool_checked_out", "Connections currently checked out", pools["checked_out"]))
+    lines.extend(_gauges("stockmaster_db_pool_overflow", "Overflow connections currently open", pools["overflow"]))
+
+    for name, help, stats in extra_gauges:
+        lines.extend(_gauges(name, help, [({"stat": key}, value) for key, value in sorted(stats.items()) if isinstance(value, (int, float))]))
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Enum as SQLEnum, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Enum as SQLEnum, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -22,6 +22,9 @@ class DocStatus(str, enum.Enum):
     DONE = "DONE"
     CANCELED = "CANCELED"
 
+OPEN_STATUSES = [DocStatus.DRAFT, DocStatus.WAITING, DocStatus.READY]
+OPEN_STATUS_FILTER = "status IN ('DRAFT', 'WAITING', 'READY')"
+
 class MoveType(str, enum.Enum):
     RECEIPT = "RECEIPT"
     DELIVERY = "DELIVERY"
@@ -97,6 +100,9 @@ class Product(Base):
 
 class StockLevel(Base):
     __tablename__ = "stock_levels"
+    __table_args__ = (
+        Index('uq_stock_level_key', 'product_id', 'warehouse_id', 'location_id', unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
@@ -110,6 +116,14 @@ class StockLevel(Base):
 
 class Document(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        Index('ix_documents_type_created_id', 'doc_type', 'created_at', 'id'),
+        Index('ix_documents_type_status_created_id', 'doc_type', 'status', 'created_at', 'id'),
+        Index(
+            'ix_documents_open_type_created_id', 'doc_type', 'created_at', 'id',
+            postgresql_where=text(OPEN_STATUS_FILTER), sqlite_where=text(OPEN_STATUS_FILTER)
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     doc_type = Column(SQLEnum(DocType), nullable=False)
@@ -141,6 +155,15 @@ class DocumentLine(Base):
 
 class StockMove(Base):
     __tablename__ = "stock_moves"
+    __table_args__ = (
+        Index('ix_stock_moves_created_id', 'created_at', 'id'),
+        Index('ix_stock_moves_product_created_id', 'product_id', 'created_at', 'id'),
+        Index('ix_stock_moves_from_warehouse_created_id', 'from_warehouse_id', 'created_at', 'id'),
+        Index('ix_stock_moves_to_warehouse_created_id', 'to_warehouse_id', 'created_at', 'id'),
+        Index('ix_stock_moves_from_location_created_id', 'from_location_id', 'created_at', 'id'),
+        Index('ix_stock_moves_to_location_created_id', 'to_location_id', 'created_at', 'id'),
+        Index('ix_stock_moves_type_created_id', 'move_type', 'created_at', 'id'),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
@@ -159,3 +182,48 @@ class StockMove(Base):
     to_warehouse = relationship("Warehouse", foreign_keys=[to_warehouse_id])
     to_location = relationship("Location", foreign_keys=[to_location_id])
     document = relationship("Document")
+
+class KpiCounter(Base):
+    __tablename__ = "kpi_counters"
+    
+    key = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class CacheVersion(Base):
+    __tablename__ = "cache_versions"
+    
+    key = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class Watermark(Base):
+    __tablename__ = "watermarks"
+    
+    key = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    changed_at = Column(DateTime, nullable=False)
+
+class StockSnapshot(Base):
+    __tablename__ = "stock_snapshots"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    taken_at = Column(DateTime, nullable=False, unique=True, index=True)
+    move_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    lines = relationship("StockSnapshotLine", back_populates="snapshot", cascade="all, delete-orphan")
+
+class StockSnapshotLine(Base):
+    __tablename__ = "stock_snapshot_lines"
+    
+    snapshot_id = Column(Integer, ForeignKey("stock_snapshots.id", ondelete="CASCADE"), primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), primary_key=True)
+    location_id = Column(Integer, ForeignKey("locations.id"), primary_key=True)
+    quantity = Column(Float, nullable=False)
+    
+    snapshot = relationship("StockSnapshot", back_populates="lines")
+
+class LowStockProduct(Base):
+    __tablename__ = "low_stock_products"
+    
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
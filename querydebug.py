@@ -0,0 +1,187 @@
+import logging
+import os
+import re
+import sys
+import time
+from contextvars import ContextVar
+from functools import lru_cache
+
+from greenlet import getcurrent
+from sqlalchemy import event
+
+QUERY_DEBUG = os.getenv("QUERY_DEBUG", "false").lower() in ("1", "true", "yes")
+N_PLUS_ONE_THRESHOLD = int(os.getenv("QUERY_DEBUG_N_PLUS_ONE", "5"))
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "0"))
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+IGNORED_FILES = {os.path.join(ROOT, "querydebug.py"), os.path.join(ROOT, "metrics.py")}
+
+logger = logging.getLogger("stockmaster.queries")
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s|\$\d+|:\w+")
+_WHITESPACE = re.compile(r"\s+")
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+class RequestQueries:
+    __slots__ = ("budget", "count", "statements")
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.count = 0
+        self.statements = {}
+
+_request_queries = ContextVar("request_queries", default=None)
+
+def enabled() -> bool:
+    return QUERY_DEBUG or QUERY_BUDGET > 0 or SLOW_QUERY_MS > 0
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    statement = _PLACEHOLDERS.sub("?", _LITERALS.sub("?", statement))
+    statement = _PLACEHOLDER_LISTS.sub("(...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+def _frame_location(frame):
+    template = frame.f_globals.get("__jinja_template__")
+    if template is not None:
+        return f"{os.path.relpath(template.filename or template.name, ROOT)}:{template.get_corresponding_lineno(frame.f_lineno)}"
+    filename = frame.f_code.co_filename
+    if filename.startswith(ROOT) and filename not in IGNORED_FILES:
+        return f"{os.path.relpath(filename, ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}"
+    return None
+
+def caller_location():
+    # Walk out of SQLAlchemy to the first template or application frame. For
+    # AsyncSession calls the statement runs in a child greenlet, so continue
+    # through the suspended parent greenlet that awaited it.
+    frame = sys._getframe(2)
+    current = getcurrent()
+    while True:
+        while frame is not None:
+            location = _frame_location(frame)
+            if location:
+                return location
+            frame = frame.f_back
+        current = current.parent
+        if current is None:
+            return "unknown"
+        frame = current.gr_frame
+
+def _explain(conn, statement: str, parameters):
+    # The plan is read on the request's own connection. On PostgreSQL a
+    # failed EXPLAIN would abort the surrounding transaction, so it runs
+    # inside a savepoint that is rolled back on error.
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    savepoint = conn.dialect.name == "postgresql"
+    cursor = conn.connection.cursor()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT query_debug_explain")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            plan = "\n".join(" ".join(str(value) for value in row) for row in cursor.fetchall())
+        except Exception as e:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT query_debug_explain")
+            plan = f"(EXPLAIN failed: {e})"
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT query_debug_explain")
+        return plan
+    except Exception as e:
+        return f"(EXPLAIN failed: {e})"
+    finally:
+        cursor.close()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    queries = _request_queries.get()
+    if queries is not None:
+        queries.count += 1
+        if queries.budget and queries.count > queries.budget:
+            raise QueryBudgetExceeded(f"Request exceeded its budget of {queries.budget} queries")
+
+    conn.info.setdefault("debug_query_started", []).append(time.perf_counter())
+    if queries is not None and QUERY_DEBUG:
+        key = fingerprint(statement)
+        entry = queries.statements.get(key)
+        if entry is None:
+            entry = queries.statements[key] = [0, set(), caller_location()]
+        entry[0] += 1
+        entry[1].add(repr(parameters))
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info["debug_query_started"].pop()) * 1000
+    if SLOW_QUERY_MS and elapsed_ms >= SLOW_QUERY_MS:
+        plan = None
+        if not executemany and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            plan = _explain(conn, statement, parameters)
+        logger.warning(
+            "Slow query (%.1f ms) from %s\n%s\nparameters: %r%s",
+            elapsed_ms, caller_location(), statement, parameters,
+            f"\nplan:\n{plan}" if plan else ""
+        )
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    stack = connection.info.get("debug_query_started") if connection is not None else None
+    if stack:
+        stack.pop()
+
+def instrument_engine(engine):
+    if not enabled():
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+def n_plus_one(queries: RequestQueries, threshold: int = N_PLUS_ONE_THRESHOLD):
+    return sorted(
+        (
+            (count, len(parameters), location, statement)
+            for statement, (count, parameters, location) in queries.statements.items()
+            if len(parameters) >= threshold
+        ),
+        reverse=True
+    )
+
+class QueryDebugMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = QUERY_BUDGET
+        if QUERY_DEBUG:
+            for name, value in scope["headers"]:
+                if name == b"x-query-budget":
+                    try:
+                        requested = int(value)
+                    except ValueError:
+                        continue
+                    if requested >= 0:
+                        budget = requested
+        queries = RequestQueries(budget)
+        token = _request_queries.set(queries)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and QUERY_DEBUG:
+                message["headers"] = list(message.get("headers", [])) + [(b"x-query-count", str(queries.count).encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_queries.reset(token)
+            if QUERY_DEBUG:
+                for count, distinct, location, statement in n_plus_one(queries):
+                    logger.warning(
+                        "Possible N+1 in %s %s: %d executions (%d distinct parameter sets) from %s\n%s",
+                        scope["method"], scope["path"], count, distinct, location, statement
+                    )
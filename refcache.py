@@ -0,0 +1,171 @@
+import os
+import time
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import insert_for
+import models
+import watermark
+
+REFERENCE_VERSION_KEY = "reference"
+USERS_VERSION_KEY = "users"
+VERSION_CHECK_INTERVAL = float(os.getenv("REFERENCE_CACHE_CHECK_INTERVAL", "2"))
+
+class WarehouseRef(NamedTuple):
+    id: int
+    name: str
+    code: str
+    address: Optional[str]
+    created_at: datetime
+
+class LocationRef(NamedTuple):
+    id: int
+    warehouse_id: int
+    name: str
+    code: str
+    created_at: datetime
+    warehouse: WarehouseRef
+
+class CategoryRef(NamedTuple):
+    id: int
+    name: str
+
+class ProductRef(NamedTuple):
+    id: int
+    name: str
+    sku: str
+    uom: str
+    reorder_level: float
+    category_id: Optional[int]
+
+class ReferenceData(NamedTuple):
+    version: int
+    warehouses: tuple
+    locations: tuple
+    categories: tuple
+    products: tuple
+    products_by_id: dict
+    locations_by_id: dict
+
+def bump_statement(db, key: str = REFERENCE_VERSION_KEY):
+    stmt = insert_for(db)(models.CacheVersion).values(key=key, version=1)
+    return stmt.on_conflict_do_update(
+        index_elements=[models.CacheVersion.key],
+        set_={"version": models.CacheVersion.version + 1}
+    )
+
+def bump_version(db: Session, key: str = REFERENCE_VERSION_KEY):
+    db.execute(bump_statement(db, key))
+    if key == REFERENCE_VERSION_KEY:
+        watermark.advance(db)
+        db.info["reference_changed"] = True
+
+def version_statement(key: str = REFERENCE_VERSION_KEY):
+    return select(models.CacheVersion.version).where(models.CacheVersion.key == key)
+
+class ReferenceCache:
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self.data = None
+        self.checked_at = 0.0
+        self.loads = 0
+
+    def invalidate(self):
+        self.data = None
+
+    async def get(self, db: AsyncSession) -> ReferenceData:
+        data = self.data
+        if data is not None and time.monotonic() - self.checked_at < self.check_interval:
+            return data
+        
+        version = (await db.scalar(version_statement())) or 0
+        if data is None or data.version != version:
+            data = await self._load(db, version)
+            self.data = data
+        self.checked_at = time.monotonic()
+        return data
+
+    async def _load(self, db: AsyncSession, version: int) -> ReferenceData:
+        warehouses = tuple(
+            WarehouseRef(*row) for row in await db.execute(
+                select(
+                    models.Warehouse.id,
+                    models.Warehouse.name,
+                    models.Warehouse.code,
+                    models.Warehouse.address,
+                    models.Warehouse.created_at
+                ).order_by(models.Warehouse.id)
+            )
+        )
+        warehouses_by_id = {warehouse.id: warehouse for warehouse in warehouses}
+        
+        locations = tuple(
+            LocationRef(*row, warehouses_by_id[row.warehouse_id]) for row in await db.execute(
+                select(
+                    models.Location.id,
+                    models.Location.warehouse_id,
+                    models.Location.name,
+                    models.Location.code,
+                    models.Location.created_at
+                ).order_by(models.Location.id)
+            )
+        )
+        
+        categories = tuple(
+            CategoryRef(*row) for row in await db.execute(
+                select(models.Category.id, models.Category.name).order_by(models.Category.id)
+            )
+        )
+        
+        products = tuple(
+            ProductRef(*row) for row in await db.execute(
+                select(
+                    models.Product.id,
+                    models.Product.name,
+                    models.Product.sku,
+                    models.Product.uom,
+                    models.Product.reorder_level,
+                    models.Product.category_id
+                ).where(models.Product.is_active == True).order_by(models.Product.id)
+            )
+        )
+        
+        self.loads += 1
+        return ReferenceData(
+            version,
+            warehouses,
+            locations,
+            categories,
+            products,
+            {product.id: product for product in products},
+            {location.id: location for location in locations}
+        )
+
+    def stats(self):
+        data = self.data
+        return {
+            "version": data.version if data else None,
+            "loads": self.loads,
+            "products": len(data.products) if data else 0
+        }
+
+reference_cache = ReferenceCache(VERSION_CHECK_INTERVAL)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop("reference_changed", False):
+        reference_cache.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("reference_changed", None)
+
+async def get_reference_data(db: AsyncSession) -> ReferenceData:
+    return await reference_cache.get(db)
+
+async def bump_version_async(db: AsyncSession, key: str = REFERENCE_VERSION_KEY):
+    await db.run_sync(bump_version, key)
@@ -1,11 +1,15 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from typing import Optional, List, Literal
 from datetime import datetime
 
 class UserBase(BaseModel):
     email: EmailStr
     name: str
 
+class TokenRequest(BaseModel):
+    email: EmailStr
+    password: str
+
 class UserCreate(UserBase):
     password: str
 
@@ -44,3 +48,17 @@ class ReceiptCreate(BaseModel):
     to_warehouse_id: int
     to_location_id: int
     lines: List[DocumentLineCreate]
+
+class DocumentCreate(BaseModel):
+    doc_type: Literal["RECEIPT", "DELIVERY", "TRANSFER", "ADJUSTMENT"]
+    supplier_name: Optional[str] = None
+    customer_name: Optional[str] = None
+    from_warehouse_id: Optional[int] = None
+    from_location_id: Optional[int] = None
+    to_warehouse_id: Optional[int] = None
+    to_location_id: Optional[int] = None
+    lines: List[DocumentLineCreate]
+
+class BatchValidation(BaseModel):
+    document_ids: List[int]
+    mode: Literal["atomic", "best_effort"] = "atomic"
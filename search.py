@@ -0,0 +1,193 @@
+import bisect
+import heapq
+import os
+import threading
+import time
+from array import array
+
+from sqlalchemy import func, or_, select, text, union
+from sqlalchemy.orm import Session
+
+import models
+import refcache
+
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "50"))
+SEARCH_CANDIDATE_LIMIT = int(os.getenv("SEARCH_CANDIDATE_LIMIT", "1000"))
+MEMORY_INDEX_TTL = int(os.getenv("SEARCH_MEMORY_INDEX_TTL", "60"))
+
+TRIGRAM_STATEMENTS = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_sku_trgm ON products USING gin (sku gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_name_lower_prefix ON products (lower(name) text_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_products_sku_lower_prefix ON products (lower(sku) text_pattern_ops)",
+]
+
+# Queries shorter than a trigram only match prefixes, on both backends.
+MIN_CONTAINS_LENGTH = 3
+
+_memory_index = None
+_memory_index_version = None
+_memory_index_built_at = 0.0
+_memory_index_checked_at = 0.0
+_memory_index_generation = 0
+_memory_index_lock = threading.Lock()
+
+def create_search_indexes(connection):
+    if connection.dialect.name != "postgresql":
+        return False
+    for statement in TRIGRAM_STATEMENTS:
+        connection.execute(text(statement))
+    return True
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _search_postgres(db: Session, query: str, limit: int):
+    # Candidates come from index-backed lookups that are each capped before
+    # ranking: the exact SKU, prefixes (lower() text_pattern_ops indexes) and,
+    # for longer queries, substrings (trigram GIN indexes). Only that bounded
+    # set is sorted, in the same order the in-memory index uses.
+    needle = query.lower()
+    escaped = _escape_like(needle)
+    prefix = f"{escaped}%"
+    name, sku = func.lower(models.Product.name), func.lower(models.Product.sku)
+    active = models.Product.is_active == True
+
+    sources = [
+        select(models.Product.id).where(active, sku == needle),
+        select(models.Product.id).where(
+            active, or_(sku.like(prefix, escape="\\"), name.like(prefix, escape="\\"))
+        ).limit(SEARCH_CANDIDATE_LIMIT)
+    ]
+    if len(needle) >= MIN_CONTAINS_LENGTH:
+        contains = f"%{escaped}%"
+        sources.append(select(models.Product.id).where(
+            active,
+            or_(
+                models.Product.sku.ilike(contains, escape="\\"),
+                models.Product.name.ilike(contains, escape="\\")
+            )
+        ).limit(SEARCH_CANDIDATE_LIMIT))
+    candidates = union(*(select(source.subquery().c.id) for source in sources)).subquery()
+
+    stmt = select(models.Product.id).join(
+        candidates, candidates.c.id == models.Product.id
+    ).order_by(
+        sku != needle,
+        ~sku.like(prefix, escape="\\"),
+        ~name.like(prefix, escape="\\"),
+        func.nullif(func.strpos(name, needle), 0),
+        models.Product.name
+    ).limit(limit)
+
+    return db.execute(stmt).scalars().all()
+
+def _trigrams(value: str):
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+class ProductSearchIndex:
+    def __init__(self, rows):
+        self.products = {}
+        self.postings = {}
+        skus = []
+        names = []
+        for product_id, name, sku in rows:
+            name_key, sku_key = name.lower(), sku.lower()
+            self.products[product_id] = (name_key, sku_key, name)
+            skus.append((sku_key, product_id))
+            names.append((name_key, product_id))
+            for gram in _trigrams(name_key) | _trigrams(sku_key):
+                self.postings.setdefault(gram, array("i")).append(product_id)
+        skus.sort()
+        names.sort()
+        self.skus = skus
+        self.names = names
+
+    def _prefix_matches(self, entries, prefix: str):
+        index = bisect.bisect_left(entries, (prefix,))
+        while index < len(entries) and entries[index][0].startswith(prefix):
+            yield entries[index][1]
+            index += 1
+
+    def _candidates(self, query: str):
+        if len(query) < MIN_CONTAINS_LENGTH:
+            return set(self._prefix_matches(self.skus, query)) | set(self._prefix_matches(self.names, query))
+
+        postings = [self.postings.get(gram) for gram in _trigrams(query)]
+        if not all(postings):
+            return set()
+        smallest = min(postings, key=len)
+        return {
+            product_id for product_id in smallest
+            if query in self.products[product_id][0] or query in self.products[product_id][1]
+        }
+
+    def search(self, query: str, limit: int):
+        query = query.lower()
+
+        def rank(product_id):
+            name_key, sku_key, name = self.products[product_id]
+            position = name_key.find(query)
+            return (
+                sku_key != query,
+                not sku_key.startswith(query),
+                not name_key.startswith(query),
+                position < 0,
+                position,
+                name
+            )
+
+        return heapq.nsmallest(limit, self._candidates(query), key=rank)
+
+def _get_memory_index(db: Session) -> ProductSearchIndex:
+    # Product writes bump the reference-data version, so an index built at
+    # an older version is rebuilt in every worker, not only the one that
+    # called invalidate(); the version is read at most once per
+    # REFERENCE_CACHE_CHECK_INTERVAL.
+    # The query runs without the lock: under run_sync it yields to the event
+    # loop, and another search on the same thread must not block on a lock
+    # held across that await. Concurrent rebuilds just race to swap in their
+    # result, and one started before an invalidate() is not kept.
+    global _memory_index, _memory_index_version, _memory_index_built_at, _memory_index_checked_at
+    with _memory_index_lock:
+        index, version, generation = _memory_index, _memory_index_version, _memory_index_generation
+        built_at, checked_at = _memory_index_built_at, _memory_index_checked_at
+    now = time.monotonic()
+    fresh = index is not None and now - built_at <= MEMORY_INDEX_TTL
+    if fresh and now - checked_at < refcache.VERSION_CHECK_INTERVAL:
+        return index
+
+    current = db.scalar(refcache.version_statement()) or 0
+    if fresh and current == version:
+        with _memory_index_lock:
+            if generation == _memory_index_generation:
+                _memory_index_checked_at = now
+        return index
+
+    rows = db.execute(
+        select(models.Product.id, models.Product.name, models.Product.sku).where(
+            models.Product.is_active == True
+        )
+    ).all()
+    index = ProductSearchIndex(rows)
+    with _memory_index_lock:
+        if generation == _memory_index_generation:
+            _memory_index = index
+            _memory_index_version = current
+            _memory_index_built_at = _memory_index_checked_at = time.monotonic()
+    return index
+
+def invalidate():
+    global _memory_index, _memory_index_generation
+    with _memory_index_lock:
+        _memory_index = None
+        _memory_index_generation += 1
+
+def search_product_ids(db: Session, query: str, limit: int = SEARCH_LIMIT):
+    query = (query or "").strip()
+    if not query:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        return _search_postgres(db, query, limit)
+    return _get_memory_index(db).search(query, limit)
@@ -0,0 +1,190 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, literal, select, union_all
+from sqlalchemy.orm import Session
+
+import models
+
+# Moves are stamped in Python before their transaction commits, so a
+# snapshot only covers moves older than this lag to avoid missing rows
+# that were still in flight when it was taken.
+SNAPSHOT_LAG = timedelta(seconds=int(os.getenv("STOCK_SNAPSHOT_LAG", "300")))
+
+def parse_timestamp(value: str) -> datetime:
+    # Timestamps are stored as naive UTC; offsets in the input are honoured
+    # and then dropped so comparisons with stored values stay naive.
+    at = datetime.fromisoformat(value)
+    if at.tzinfo is not None:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    return at
+
+def _filtered(statement, columns, product_id=None, warehouse_id=None, location_id=None):
+    product_column, warehouse_column, location_column = columns
+    if product_id is not None:
+        statement = statement.where(product_column == product_id)
+    if warehouse_id is not None:
+        statement = statement.where(warehouse_column == warehouse_id)
+    if location_id is not None:
+        statement = statement.where(location_column == location_id)
+    return statement
+
+def _move_deltas(start: datetime, end: datetime, sign: int, **filters):
+    # Net effect of the moves in [start, end) on each stock key, multiplied
+    # by sign: +1 replays them forward, -1 rolls them back.
+    move = models.StockMove
+    window = [move.created_at >= start] if start else []
+    if end:
+        window.append(move.created_at < end)
+    
+    outgoing = _filtered(
+        select(
+            move.product_id,
+            move.from_warehouse_id.label("warehouse_id"),
+            move.from_location_id.label("location_id"),
+            (move.quantity * -sign).label("quantity")
+        ).where(move.from_warehouse_id.isnot(None), *window),
+        (move.product_id, move.from_warehouse_id, move.from_location_id),
+        **filters
+    )
+    incoming = _filtered(
+        select(
+            move.product_id,
+            move.to_warehouse_id.label("warehouse_id"),
+            move.to_location_id.label("location_id"),
+            (move.quantity * sign).label("quantity")
+        ).where(move.to_warehouse_id.isnot(None), *window),
+        (move.product_id, move.to_warehouse_id, move.to_location_id),
+        **filters
+    )
+    return [outgoing, incoming]
+
+def _current_levels(**filters):
+    level = models.StockLevel
+    return _filtered(
+        select(level.product_id, level.warehouse_id, level.location_id, level.quantity_on_hand.label("quantity")),
+        (level.product_id, level.warehouse_id, level.location_id),
+        **filters
+    )
+
+def _snapshot_lines(snapshot_id: int, **filters):
+    line = models.StockSnapshotLine
+    return _filtered(
+        select(line.product_id, line.warehouse_id, line.location_id, line.quantity).where(
+            line.snapshot_id == snapshot_id
+        ),
+        (line.product_id, line.warehouse_id, line.location_id),
+        **filters
+    )
+
+def nearest_snapshot(db: Session, at: datetime):
+    before = db.query(models.StockSnapshot).filter(
+        models.StockSnapshot.taken_at <= at
+    ).order_by(models.StockSnapshot.taken_at.desc()).first()
+    after = db.query(models.StockSnapshot).filter(
+        models.StockSnapshot.taken_at > at
+    ).order_by(models.StockSnapshot.taken_at).first()
+    
+    candidates = [snapshot for snapshot in (before, after) if snapshot is not None]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda snapshot: abs(snapshot.taken_at - at))
+
+def as_of_statement(db: Session, at: datetime, **filters):
+    # Stock as of `at` covers every move created before it. The base is the
+    # snapshot closest to `at` (or the live stock_levels when no snapshot is
+    # closer), and only the moves between the base and `at` are replayed.
+    snapshot = nearest_snapshot(db, at)
+    now = datetime.utcnow()
+    
+    if snapshot is not None and abs(snapshot.taken_at - at) <= abs(now - at):
+        base = _snapshot_lines(snapshot.id, **filters)
+        if snapshot.taken_at <= at:
+            deltas = _move_deltas(snapshot.taken_at, at, 1, **filters)
+        else:
+            deltas = _move_deltas(at, snapshot.taken_at, -1, **filters)
+    else:
+        snapshot = None
+        base = _current_levels(**filters)
+        deltas = _move_deltas(at, None, -1, **filters)
+    
+    rows = union_all(base, *deltas).subquery()
+    statement = select(
+        rows.c.product_id,
+        rows.c.warehouse_id,
+        rows.c.location_id,
+        func.sum(rows.c.quantity).label("quantity")
+    ).group_by(
+        rows.c.product_id, rows.c.warehouse_id, rows.c.location_id
+    ).having(
+        func.sum(rows.c.quantity) != 0
+    ).order_by(
+        rows.c.product_id, rows.c.warehouse_id, rows.c.location_id
+    )
+    return statement, snapshot
+
+def stock_as_of(db: Session, at: datetime, product_id: int = None, warehouse_id: int = None, location_id: int = None):
+    statement, snapshot = as_of_statement(
+        db, at, product_id=product_id, warehouse_id=warehouse_id, location_id=location_id
+    )
+    rows = db.execute(statement).all()
+    return {
+        "as_of": at.isoformat(),
+        "snapshot": snapshot.taken_at.isoformat() if snapshot else None,
+        "items": [
+            {
+                "product_id": product_id,
+                "warehouse_id": warehouse_id,
+                "location_id": location_id,
+                "quantity": quantity
+            }
+            for product_id, warehouse_id, location_id, quantity in rows
+        ]
+    }
+
+def moves_since_last_snapshot(db: Session, at: datetime) -> int:
+    last = db.query(func.max(models.StockSnapshot.taken_at)).filter(
+        models.StockSnapshot.taken_at <= at
+    ).scalar()
+    query = db.query(func.count(models.StockMove.id)).filter(models.StockMove.created_at < at)
+    if last is not None:
+        query = query.filter(models.StockMove.created_at >= last)
+    return query.scalar()
+
+def take_snapshot(db: Session, at: datetime = None, min_moves: int = 0):
+    at = at or datetime.utcnow() - SNAPSHOT_LAG
+    if db.query(models.StockSnapshot.id).filter(models.StockSnapshot.taken_at == at).first():
+        raise ValueError(f"A snapshot at {at.isoformat()} already exists")
+    
+    move_count = moves_since_last_snapshot(db, at)
+    if move_count < min_moves:
+        return None
+    
+    statement, _ = as_of_statement(db, at)
+    snapshot = models.StockSnapshot(taken_at=at, move_count=move_count)
+    db.add(snapshot)
+    db.flush()
+    
+    lines = statement.subquery()
+    db.execute(insert(models.StockSnapshotLine).from_select(
+        ["snapshot_id", "product_id", "warehouse_id", "location_id", "quantity"],
+        select(literal(snapshot.id), lines.c.product_id, lines.c.warehouse_id, lines.c.location_id, lines.c.quantity)
+    ))
+    db.commit()
+    return snapshot
+
+def prune_snapshots(db: Session, keep: int):
+    stale = [
+        snapshot_id for (snapshot_id,) in db.query(models.StockSnapshot.id).order_by(
+            models.StockSnapshot.taken_at.desc()
+        ).offset(keep)
+    ]
+    if stale:
+        db.query(models.StockSnapshotLine).filter(
+            models.StockSnapshotLine.snapshot_id.in_(stale)
+        ).delete(synchronize_session=False)
+        db.query(models.StockSnapshot).filter(
+            models.StockSnapshot.id.in_(stale)
+        ).delete(synchronize_session=False)
+        db.commit()
+    return len(stale)
@@ -0,0 +1,24 @@
+// Subscribes to /events and hands each committed change to onChange.
+// Missed changes cannot be replayed, so the page reloads after a resync
+// marker or once a dropped connection comes back.
+function liveUpdates(onChange) {
+    if (!window.EventSource) {
+        return;
+    }
+    var source = new EventSource('/events');
+    var disconnected = false;
+    source.onmessage = function (event) {
+        onChange(JSON.parse(event.data));
+    };
+    source.addEventListener('resync', function () {
+        window.location.reload();
+    });
+    source.onerror = function () {
+        disconnected = true;
+    };
+    source.onopen = function () {
+        if (disconnected) {
+            window.location.reload();
+        }
+    };
+}
@@ -0,0 +1,118 @@
+import os
+from collections import OrderedDict
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import refcache
+import watermark
+
+VALUATION_TOP_N = int(os.getenv("VALUATION_TOP_N", "20"))
+VALUATION_CACHE_SIZE = 16
+
+_cache = OrderedDict()
+
+def _value():
+    return models.StockLevel.quantity_on_hand * func.coalesce(models.Product.cost, 0.0)
+
+def valuation_statement():
+    return select(
+        models.StockLevel.warehouse_id,
+        models.StockLevel.location_id,
+        models.Product.category_id,
+        func.sum(models.StockLevel.quantity_on_hand),
+        func.sum(_value())
+    ).join(
+        models.Product, models.Product.id == models.StockLevel.product_id
+    ).group_by(
+        models.StockLevel.warehouse_id,
+        models.StockLevel.location_id,
+        models.Product.category_id
+    )
+
+def top_products_statement(limit: int):
+    value = func.sum(_value()).label("value")
+    return select(
+        models.Product.id,
+        models.Product.sku,
+        models.Product.name,
+        func.sum(models.StockLevel.quantity_on_hand),
+        value
+    ).join(
+        models.Product, models.Product.id == models.StockLevel.product_id
+    ).group_by(
+        models.Product.id, models.Product.sku, models.Product.name
+    ).order_by(value.desc(), models.Product.id).limit(limit)
+
+def _add(totals: dict, key, quantity: float, value: float):
+    entry = totals.get(key)
+    if entry is None:
+        totals[key] = [quantity, value]
+    else:
+        entry[0] += quantity
+        entry[1] += value
+
+def _ranked(totals: dict, label):
+    return sorted(
+        (
+            {"key": key, "label": label(key), "quantity": quantity, "value": value}
+            for key, (quantity, value) in totals.items()
+        ),
+        key=lambda row: -row["value"]
+    )
+
+def build_report(rows, top_products, reference: refcache.ReferenceData):
+    warehouses = {warehouse.id: warehouse for warehouse in reference.warehouses}
+    locations = {location.id: location for location in reference.locations}
+    categories = {category.id: category.name for category in reference.categories}
+    
+    by_warehouse, by_location, by_category = {}, {}, {}
+    total_quantity = total_value = 0.0
+    for warehouse_id, location_id, category_id, quantity, value in rows:
+        quantity, value = quantity or 0.0, value or 0.0
+        _add(by_warehouse, warehouse_id, quantity, value)
+        _add(by_location, location_id, quantity, value)
+        _add(by_category, category_id, quantity, value)
+        total_quantity += quantity
+        total_value += value
+    
+    def warehouse_label(warehouse_id):
+        warehouse = warehouses.get(warehouse_id)
+        return f"{warehouse.name} ({warehouse.code})" if warehouse else f"Warehouse {warehouse_id}"
+    
+    def location_label(location_id):
+        location = locations.get(location_id)
+        return f"{location.warehouse.code} / {location.code}" if location else f"Location {location_id}"
+    
+    return {
+        "total_quantity": total_quantity,
+        "total_value": total_value,
+        "warehouses": _ranked(by_warehouse, warehouse_label),
+        "locations": _ranked(by_location, location_label),
+        "categories": _ranked(by_category, lambda category_id: categories.get(category_id, "Uncategorized")),
+        "top_products": [
+            {"id": product_id, "sku": sku, "name": name, "quantity": quantity or 0.0, "value": value or 0.0}
+            for product_id, sku, name, quantity, value in top_products
+        ]
+    }
+
+async def get_valuation(db: AsyncSession, top: int = VALUATION_TOP_N):
+    # Stock moves advance the watermark and product or location changes
+    # bump "reference", so a cached report stays valid until either moves.
+    mark = await watermark.get_watermark(db)
+    reference = await refcache.get_reference_data(db)
+    key = (mark.version, reference.version, top)
+    report = _cache.get(key)
+    if report is not None:
+        _cache.move_to_end(key)
+        return report
+    
+    rows = (await db.execute(valuation_statement())).all()
+    top_products = (await db.execute(top_products_statement(top))).all()
+    report = build_report(rows, top_products, reference)
+    
+    _cache[key] = report
+    while len(_cache) > VALUATION_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return report
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import NamedTuple, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import insert_for
+import models
+
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", "30"))
+PAGE_CACHE_SIZE = int(os.getenv("PAGE_CACHE_SIZE", "128"))
+
+GLOBAL_KEY = "global"
+
+class Watermark(NamedTuple):
+    version: int
+    changed_at: Optional[datetime]
+
+def warehouse_key(warehouse_id: int) -> str:
+    return f"warehouse:{warehouse_id}"
+
+def advance(db: Session, warehouse_ids=()):
+    # Stock writers only touch the rows of the warehouses they change, in
+    # sorted order; the global row is for changes that belong to no
+    # warehouse, and the global watermark is summed at read time.
+    now = datetime.utcnow()
+    keys = [
+        warehouse_key(warehouse_id)
+        for warehouse_id in sorted({warehouse_id for warehouse_id in warehouse_ids if warehouse_id is not None})
+    ] or [GLOBAL_KEY]
+    stmt = insert_for(db)(models.Watermark).values([
+        {"key": key, "version": 1, "changed_at": now} for key in keys
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Watermark.key],
+        set_={"version": models.Watermark.version + 1, "changed_at": stmt.excluded.changed_at}
+    )
+    db.execute(stmt)
+
+def watermark_statement(warehouse_id: Optional[int] = None):
+    # Versions only grow, so their sum moves whenever any summed row does.
+    stmt = select(func.coalesce(func.sum(models.Watermark.version), 0), func.max(models.Watermark.changed_at))
+    if warehouse_id is not None:
+        stmt = stmt.where(models.Watermark.key.in_([GLOBAL_KEY, warehouse_key(warehouse_id)]))
+    return stmt
+
+async def get_watermark(db: AsyncSession, warehouse_id: Optional[int] = None) -> Watermark:
+    return Watermark(*(await db.execute(watermark_statement(warehouse_id))).one())
+
+class PageCache:
+    def __init__(self, ttl: int, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: str, page):
+        if self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, page)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+page_cache = PageCache(PAGE_CACHE_TTL, PAGE_CACHE_SIZE)
+
+def _etag(mark: Watermark, request: Request, user_id: int) -> str:
+    changed = int(mark.changed_at.timestamp() * 1000000) if mark.changed_at else 0
+    digest = hashlib.blake2b(f"{user_id} {request.url.path}?{request.url.query}".encode(), digest_size=8).hexdigest()
+    return f'W/"{mark.version}.{changed}-{digest}"'
+
+def _is_fresh(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return since.tzinfo is not None and last_modified.replace(microsecond=0) <= since
+    return False
+
+async def conditional(request: Request, db: AsyncSession, user_id: int, render, warehouse_id: Optional[int] = None) -> Response:
+    # One read of the small watermarks table decides between 304, a cached
+    # body and calling render(); the page cache key carries the watermark, so a write never
+    # serves a stale body and the TTL only bounds memory.
+    mark = await get_watermark(db, warehouse_id)
+    etag = _etag(mark, request, user_id)
+    last_modified = mark.changed_at.replace(tzinfo=timezone.utc) if mark.changed_at else None
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if _is_fresh(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    page = page_cache.get(etag)
+    if page is None:
+        response = await render()
+        if response.status_code != 200:
+            return response
+        page = (response.body, response.media_type)
+        page_cache.put(etag, page)
+    return Response(page[0], media_type=page[1], headers=headers)